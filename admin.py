@@ -2,25 +2,42 @@ import os
 from telegram import Update
 from telegram.ext import ContextTypes
 import database
+import metrics
+import broadcast
 
 # You should move ADMIN_ID to .env logic in main bot, but here we can check specific IDs
 # or a list of IDs.
 ADMIN_IDS = [int(os.getenv("ADMIN_ID", "0"))] 
 
+# Telegram allows about 30 messages/s per bot in total; keep headroom for replies.
+BROADCASTER = broadcast.Broadcaster(rate=float(os.getenv("BROADCAST_RATE", "25")))
+
+def _refresh_tier(context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    """Make the bot pick up a subscription change right away."""
+    store = context.bot_data.get("sessions")
+    if store is not None:
+        store.invalidate(user_id)
+
 async def admin_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handler for /admin command."""
     user_id = update.effective_user.id
     if user_id not in ADMIN_IDS:
         return # Silent ignore
     
-    total, premium = database.get_stats()
+    stats = await database.get_stats_async()
+    latency = metrics.summary() or "no data yet"
     msg = (
         f"🕵️‍♂️ **Admin Panel**\n\n"
-        f"👥 Total Users: {total}\n"
-        f"💎 Premium Users: {premium}\n\n"
+        f"👥 Total Users: {stats['total_users']} (+{stats['new_today']} today)\n"
+        f"💎 Premium Users: {stats['premium_users']} ({stats['premium_conversion']:.1%})\n"
+        f"🔥 Active Today: {stats['active_today']}\n"
+        f"💬 Messages Today: {stats['messages_today']}\n\n"
+        f"⏱ Latency (this process):\n```\n{latency}\n```\n\n"
         f"Commands:\n"
         f"`/add_premium <user_id>` - Give premium\n"
-        f"`/remove_premium <user_id>` - Remove premium"
+        f"`/remove_premium <user_id>` - Remove premium\n"
+        f"`/broadcast <text>` - Message all users\n"
+        f"`/broadcast_cancel` - Stop the running broadcast"
     )
     await update.message.reply_text(msg, parse_mode="Markdown")
 
@@ -32,7 +49,8 @@ async def add_premium(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         target_id = int(context.args[0])
-        database.set_subscription(target_id, 1)
+        await database.set_subscription_async(target_id, 1)
+        _refresh_tier(context, target_id)
         await update.message.reply_text(f"✅ Premium granted to user {target_id}")
         # Notify user (optional, requires bot to have chat with user)
         try:
@@ -50,7 +68,47 @@ async def remove_premium(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         target_id = int(context.args[0])
-        database.set_subscription(target_id, 0)
+        await database.set_subscription_async(target_id, 0)
+        _refresh_tier(context, target_id)
         await update.message.reply_text(f"❌ Premium removed from user {target_id}")
     except (IndexError, ValueError):
         await update.message.reply_text("Usage: /remove_premium <user_id>")
+
+async def start_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Send a message to every user (/broadcast <text>)."""
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        return
+
+    # Keep the admin's line breaks: take the raw text after the command.
+    parts = update.message.text.split(None, 1)
+    if len(parts) < 2:
+        # Progress as of the last checkpoint if another process is sending it
+        job = BROADCASTER.progress if BROADCASTER.running else await database.get_running_broadcast_async()
+        if job is not None:
+            await update.message.reply_text(
+                f"📣 Broadcast #{job['id']} running: {job['sent']} sent, "
+                f"{job['unreachable']} unreachable, {job['failed']} failed"
+            )
+        else:
+            await update.message.reply_text("Usage: /broadcast <text>")
+        return
+
+    try:
+        broadcast_id = await BROADCASTER.start(context.bot, parts[1], update.effective_chat.id)
+    except RuntimeError as e:
+        await update.message.reply_text(f"⚠️ Can't start broadcast: {e}")
+        return
+    await update.message.reply_text(f"📣 Broadcast #{broadcast_id} started")
+
+async def cancel_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stop the running broadcast."""
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        return
+
+    broadcast_id = await BROADCASTER.cancel()
+    if broadcast_id is None:
+        await update.message.reply_text("No broadcast is running.")
+    else:
+        await update.message.reply_text(f"🛑 Broadcast #{broadcast_id} cancelled")
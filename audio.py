@@ -0,0 +1,100 @@
+import os
+import shutil
+import asyncio
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# ElevenLabs output formats are named <codec>_<sample rate>[_<kbit/s>],
+# e.g. "opus_48000_32" or "mp3_44100_128". Opus comes back in an Ogg
+# container, which is what Telegram expects for voice notes.
+FALLBACK_FORMAT = "mp3_44100_128"
+
+_stats = {}
+
+def parse_format(output_format: str):
+    """Split an ElevenLabs output format into (codec, sample_rate, kbps)."""
+    parts = output_format.split("_")
+    codec = parts[0]
+    sample_rate = int(parts[1]) if len(parts) > 1 else None
+    kbps = int(parts[2]) if len(parts) > 2 else None
+    return codec, sample_rate, kbps
+
+def extension(output_format: str) -> str:
+    codec = parse_format(output_format)[0]
+    return "ogg" if codec == "opus" else codec
+
+def is_opus(output_format: str) -> bool:
+    return parse_format(output_format)[0] == "opus"
+
+def has_ffmpeg() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+async def _ffmpeg(args, data: bytes = None) -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", *args,
+        stdin=asyncio.subprocess.PIPE if data is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await process.communicate(data)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {err.decode(errors='replace').strip()}")
+    return out
+
+def _encoder_args(output_format: str):
+    codec, sample_rate, kbps = parse_format(output_format)
+    if codec == "opus":
+        args = ["-c:a", "libopus", "-application", "voip", "-f", "ogg"]
+    elif codec == "mp3":
+        args = ["-c:a", "libmp3lame", "-f", "mp3"]
+    else:
+        raise ValueError(f"Cannot encode to {output_format}")
+    if kbps:
+        args += ["-b:a", f"{kbps}k"]
+    if sample_rate:
+        args += ["-ar", str(sample_rate)]
+    return args + ["-ac", "1"]
+
+async def transcode(data: bytes, output_format: str) -> bytes:
+    """Re-encode audio (any format ffmpeg can read) to output_format."""
+    return await _ffmpeg(["-i", "pipe:0", *_encoder_args(output_format), "pipe:1"], data)
+
+async def join(parts, output_format: str = FALLBACK_FORMAT) -> bytes:
+    """Concatenate audio clips of the same format into one clip.
+
+    MP3 is a sequence of independent frames, so clips can be joined by simply
+    appending their bytes. Ogg/Opus clips are remuxed by ffmpeg into a single
+    stream; without ffmpeg they are chained, which is valid Ogg but not every
+    player handles it.
+    """
+    parts = [part for part in parts if part]
+    if len(parts) < 2 or not is_opus(output_format):
+        return b"".join(parts)
+    if not has_ffmpeg():
+        logger.warning("ffmpeg not found, sending chained Ogg stream")
+        return b"".join(parts)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        listing = []
+        for i, part in enumerate(parts):
+            path = os.path.join(tmp, f"{i}.ogg")
+            with open(path, "wb") as f:
+                f.write(part)
+            listing.append(f"file '{path}'")
+        list_path = os.path.join(tmp, "list.txt")
+        with open(list_path, "w") as f:
+            f.write("\n".join(listing))
+        return await _ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", "-f", "ogg", "pipe:1"])
+
+def record_sent(profile: str, nbytes: int):
+    """Track payload size per audio profile and log it."""
+    count, total = _stats.get(profile, (0, 0))
+    count, total = count + 1, total + nbytes
+    _stats[profile] = (count, total)
+    logger.info(f"Voice payload: {nbytes} bytes, profile={profile} (avg {total // count} bytes over {count} messages)")
+
+def sent_stats():
+    """{profile: (messages, total_bytes)}"""
+    return dict(_stats)
@@ -0,0 +1,193 @@
+"""Throughput and latency benchmark for bot.py, without real API credits.
+
+Starts local fakes for Telegram (fake_telegram.py), OpenRouter and ElevenLabs
+(fake_upstreams.py), then drives the real handlers (start, button_click,
+handle_message) with synthetic updates through Application.process_update.
+
+    python benchmark.py                    # run and print the report
+    python benchmark.py --save-baseline    # also store it in bench_baseline.json
+    python benchmark.py --compare          # exit 1 if worse than the baseline
+
+Reports messages/sec, end-to-end latency percentiles per update type, DB
+queueing (time spent waiting for the database thread) and memory.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import tracemalloc
+
+from fake_telegram import FakeBotAPI, UpdateFactory
+from fake_upstreams import FakeOpenRouter, FakeElevenLabs, Profile
+
+BASELINE_FILE = "bench_baseline.json"
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[index]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=3, help="text messages per user")
+    parser.add_argument("--premium-ratio", type=float, default=0.2)
+    parser.add_argument("--streaming", action="store_true", help="benchmark STREAMING_TTS mode")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--tts-latency", type=float, default=0.2)
+    parser.add_argument("--tts-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.01)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    return parser.parse_args()
+
+def configure_environment(args, telegram, openrouter, elevenlabs, workdir):
+    """Point the bot at the fakes. Must run before bot is imported."""
+    os.environ.update({
+        "TELEGRAM_TOKEN": "123456:benchmark",
+        "OPENROUTER_API_KEY": "benchmark",
+        "ELEVENLABS_API_KEY": "benchmark",
+        "ADMIN_ID": "0",
+        "TELEGRAM_API_URL": telegram.url,
+        "OPENROUTER_BASE_URL": f"{openrouter.url}/api/v1",
+        "ELEVENLABS_BASE_URL": elevenlabs.url,
+        "DATABASE_PATH": os.path.join(workdir, "bench.db"),
+        "UPSELL_CACHE_DIR": os.path.join(workdir, "upsell"),
+        "VOICE_SNAPSHOT_PATH": os.path.join(workdir, "voices.json"),
+        "STREAMING_TTS": "1" if args.streaming else "0",
+        "AUDIO_FORMAT_FREE": "mp3_44100_128",
+        "AUDIO_FORMAT_PREMIUM": "mp3_44100_128",
+        "RATE_LIMIT_BURST": str(args.messages + 1),
+        "COALESCE_MESSAGES": "0",
+        "SHOW_QUEUE_POSITION": "0",
+    })
+
+async def run(args, telegram, elevenlabs):
+    import bot
+    import database
+    import metrics
+    from telegram import Update
+
+    application = bot.build_application(updater=False)
+    factory = UpdateFactory()
+    latencies = {"start": [], "button": [], "message": []}
+    failures = 0
+
+    async def drive(kind, data):
+        nonlocal failures
+        started = time.perf_counter()
+        try:
+            await application.process_update(Update.de_json(data, application.bot))
+        except Exception:
+            failures += 1
+        latencies[kind].append(time.perf_counter() - started)
+
+    async with application:
+        await application.post_init(application)
+        users = range(1, args.users + 1)
+        premium = set(list(users)[:int(args.users * args.premium_ratio)])
+
+        # Onboarding: /start, language, voice
+        await asyncio.gather(*(drive("start", factory.message(u, "/start")) for u in users))
+        for user_id in premium:
+            await database.set_subscription_async(user_id, 1)
+        voice_id = bot.CATALOG.default_voice_id()
+        await asyncio.gather(*(drive("button", factory.callback(u, "lang_en")) for u in users))
+        await asyncio.gather(*(drive("button", factory.callback(u, f"select_{voice_id}")) for u in users))
+
+        # Load: every user sends its messages one after another, users in parallel
+        async def chat(user_id):
+            for i in range(args.messages):
+                await drive("message", factory.message(user_id, f"I had a rough day at work ({i})"))
+
+        voices_before = telegram.calls["sendVoice"]
+        started = time.perf_counter()
+        await asyncio.gather(*(chat(u) for u in users))
+        elapsed = time.perf_counter() - started
+        voices_sent = telegram.calls["sendVoice"] - voices_before
+
+        db_wait = metrics._histograms.get(("db_seconds", (("phase", "wait"),)))
+        db_query = metrics._histograms.get(("db_seconds", (("phase", "query"),)))
+        await application.post_shutdown(application)
+
+    total_messages = args.users * args.messages
+    report = {
+        "config": {
+            "users": args.users, "messages": args.messages, "premium_ratio": args.premium_ratio,
+            "streaming": args.streaming, "llm_latency": args.llm_latency, "tts_latency": args.tts_latency,
+            "llm_error_rate": args.llm_error_rate, "tts_error_rate": args.tts_error_rate,
+        },
+        "messages_per_sec": round(total_messages / elapsed, 2),
+        "wall_seconds": round(elapsed, 3),
+        "voices_sent": voices_sent,
+        "handler_failures": failures,
+        "latency": {
+            kind: {f"p{int(q * 100)}": round(percentile(values, q), 4) for q in (0.5, 0.95, 0.99)}
+            for kind, values in latencies.items()
+        },
+        "db": {
+            "wait_p95": round(db_wait.quantile(0.95), 4) if db_wait else 0.0,
+            "query_p95": round(db_query.quantile(0.95), 4) if db_query else 0.0,
+            "busy_errors": metrics._counters.get(("db_busy_errors_total", ()), 0),
+        },
+        "tts_characters": elevenlabs.characters,
+        "memory": {
+            "python_peak_mb": round(tracemalloc.get_traced_memory()[1] / 2**20, 2),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+    }
+    return report
+
+def compare(report, baseline, tolerance):
+    """Return a list of regressions of report against baseline."""
+    problems = []
+    if report["config"] != baseline["config"]:
+        problems.append(f"config differs from baseline: {baseline['config']}")
+        return problems
+    if report["messages_per_sec"] < baseline["messages_per_sec"] * (1 - tolerance):
+        problems.append(f"throughput {report['messages_per_sec']}/s < baseline {baseline['messages_per_sec']}/s")
+    for q in ("p50", "p95"):
+        now, before = report["latency"]["message"][q], baseline["latency"]["message"][q]
+        if now > before * (1 + tolerance):
+            problems.append(f"message latency {q} {now}s > baseline {before}s")
+    return problems
+
+def main():
+    args = parse_args()
+    telegram = FakeBotAPI(latency=args.telegram_latency).start()
+    openrouter = FakeOpenRouter(Profile(args.llm_latency, args.jitter, args.llm_error_rate)).start()
+    elevenlabs = FakeElevenLabs(Profile(args.tts_latency, args.jitter, args.tts_error_rate, error_status=429)).start()
+    tracemalloc.start()
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(args, telegram, openrouter, elevenlabs, workdir)
+        report = asyncio.run(run(args, telegram, elevenlabs))
+    for server in (telegram, openrouter, elevenlabs):
+        server.stop()
+
+    print(json.dumps(report, indent=2))
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+    if args.compare:
+        with open(args.baseline) as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
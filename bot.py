@@ -1,24 +1,55 @@
 import os
 import logging
 import asyncio
+import time
 import math
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 
 from openai import AsyncOpenAI
-from elevenlabs.client import ElevenLabs
+from elevenlabs.core.api_error import ApiError
 # Load environment variables
 load_dotenv()
 
 import database
 import admin
+import speech
+import audio
+import upsell
+import tts
+import voices
+import ratelimit
+import scheduler
+import webhook
+import metrics
+import llm
+import sessions
+import dedup
+import memory
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL") # Override Telegram API host (testing)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL") # None = official API
+
+# Serving: "polling" (single process) or "webhook" (HTTP server that shards
+# updates by sender across WEBHOOK_WORKERS processes sharing bot.db)
+SERVE_MODE = os.getenv("SERVE_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL") # Public URL registered with Telegram
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+WORKER_PROCESSES = WEBHOOK_WORKERS if SERVE_MODE == "webhook" else 1
+# Prometheus metrics endpoint (disabled when unset; webhook worker N uses port + N)
+METRICS_PORT = os.getenv("METRICS_PORT")
 
 # Configure logging
 logging.basicConfig(
@@ -27,17 +58,107 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def per_process(limit: int) -> int:
+    """This process's share of a bot-wide limit (webhook workers split it evenly)."""
+    return max(1, limit // WORKER_PROCESSES)
+
 # Initialize clients
 openai_client = AsyncOpenAI(
     api_key=OPENROUTER_API_KEY,
-    base_url="https://openrouter.ai/api/v1",
+    base_url=OPENROUTER_BASE_URL,
+)
+# Concurrency should match the ElevenLabs plan (Free 2, Starter 3, Creator 5, Pro 10);
+# it is the limit for the whole bot, so each webhook worker gets its share.
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "2"))
+tts_client = tts.TTSClient(
+    api_key=ELEVENLABS_API_KEY,
+    max_concurrency=per_process(TTS_MAX_CONCURRENCY),
+    max_retries=int(os.getenv("TTS_MAX_RETRIES", "3")),
+    base_url=ELEVENLABS_BASE_URL,
 )
-elevenlabs_client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
 
 # Global Variables
-ALL_VOICES = [] # List of voice objects
 VOICES_PER_PAGE = 5
+CATALOG = voices.VoiceCatalog(per_page=VOICES_PER_PAGE)
+# The catalog is served from this snapshot at boot and refreshed from
+# ElevenLabs in the background every VOICE_REFRESH_SECONDS.
+VOICE_SNAPSHOT_PATH = os.getenv("VOICE_SNAPSHOT_PATH", os.path.join("cache", "voices.json"))
+VOICE_REFRESH_SECONDS = float(os.getenv("VOICE_REFRESH_SECONDS", "3600"))
+VOICE_RETRY_SECONDS = 30
+# Language, voice, tier and today's count per user, cached in memory and
+# written back to SQLite in batches.
+SESSIONS = sessions.SessionStore(max_size=int(os.getenv("SESSION_CACHE_SIZE", "100000")))
+FREE_DAILY_LIMIT = 3
+# Drops messages Telegram delivers twice (restart, webhook retry) before any
+# LLM/TTS money is spent on them.
+DEDUP = dedup.UpdateDeduplicator()
 RATE_LIMIT_SECONDS = 30 # Reduced since we have db limits
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "2"))
+RATE_LIMITER = ratelimit.RateLimiter(period=RATE_LIMIT_SECONDS, burst=RATE_LIMIT_BURST)
+# Coalescing: messages that arrive while a reply for the same user is being
+# generated are merged into a single follow-up reply.
+COALESCE_MESSAGES = os.getenv("COALESCE_MESSAGES", "1") == "1"
+_coalesced = {} # user_id -> [update, ...] waiting for the in-flight reply
+
+# Global admission control: a fixed pool of workers runs the LLM+TTS work,
+# premium first. Each lane sheds load beyond its max queue depth. The sizes
+# are for the whole bot and split across webhook workers.
+SCHEDULER = scheduler.JobScheduler(
+    workers=per_process(int(os.getenv("SCHEDULER_WORKERS", "8"))),
+    max_depth={
+        scheduler.LANE_PREMIUM: per_process(int(os.getenv("QUEUE_MAX_PREMIUM", "200"))),
+        scheduler.LANE_FREE: per_process(int(os.getenv("QUEUE_MAX_FREE", "50"))),
+    },
+)
+SHOW_QUEUE_POSITION = os.getenv("SHOW_QUEUE_POSITION", "1") == "1"
+
+metrics.gauge("tts_queue_depth", lambda: tts_client.queue_depth)
+metrics.gauge("tts_in_flight", lambda: tts_client.in_flight)
+metrics.gauge("scheduler_busy_workers", lambda: SCHEDULER.busy)
+metrics.gauge("scheduler_queue_depth", lambda: {(("lane", lane),): depth for lane, depth in SCHEDULER.depth.items()})
+metrics.gauge("scheduler_shed_total", lambda: SCHEDULER.shed)
+# Model chain: tried in order, with a hedged request to the next model when
+# the current one is slow (LLM_HEDGE_AFTER) and a hard per-call deadline.
+LLM_MODELS = [m.strip() for m in os.getenv(
+    "LLM_MODELS", "xiaomi/mimo-v2-flash:free,meta-llama/llama-3.3-70b-instruct:free"
+).split(",") if m.strip()]
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "45"))
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "8"))
+TTS_MODEL = "eleven_multilingual_v2"
+llm_router = llm.LLMRouter(
+    openai_client,
+    LLM_MODELS,
+    deadline=LLM_DEADLINE,
+    hedge_after=LLM_HEDGE_AFTER,
+    extra_body={"HTTP-Referer": "https://telegram.bot", "X-Title": "Emotional Support Bot"},
+)
+
+# Streaming mode: TTS starts on each sentence while the LLM is still writing.
+# STREAMING_DELIVERY = "single" sends one voice message, "progressive" sends
+# a voice message per sentence as soon as it is ready.
+STREAMING_TTS = os.getenv("STREAMING_TTS", "0") == "1"
+STREAMING_DELIVERY = os.getenv("STREAMING_DELIVERY", "single")
+# Segmented mode (non-streaming): the finished reply is split at sentence
+# boundaries and the segments are synthesized in parallel, then stitched.
+SEGMENTED_TTS = os.getenv("SEGMENTED_TTS", "0") == "1"
+# More parallel segments than TTS slots would only queue in tts_client.
+SEGMENTED_TTS_FANOUT = min(
+    int(os.getenv("SEGMENTED_TTS_FANOUT", str(tts_client.max_concurrency))), tts_client.max_concurrency
+)
+UPSELL_CACHE_DIR = os.getenv("UPSELL_CACHE_DIR", os.path.join("cache", "upsell"))
+
+# Audio profile (ElevenLabs output format: codec_samplerate_kbps) per
+# subscription level. Opus in Ogg is what Telegram voice notes use natively.
+AUDIO_PROFILES = {
+    0: os.getenv("AUDIO_FORMAT_FREE", "opus_48000_32"),
+    1: os.getenv("AUDIO_FORMAT_PREMIUM", "opus_48000_64"),
+}
+# AUDIO_TRANSCODE=1 always requests MP3 and encodes the profile locally with ffmpeg
+AUDIO_TRANSCODE = os.getenv("AUDIO_TRANSCODE", "0") == "1"
+_native_format_unsupported = set()
+
+# Keeps references to fire-and-forget tasks so they are not garbage collected
+_background_tasks = set()
 
 # Localization Strings
 TEXTS = {
@@ -53,6 +174,8 @@ TEXTS = {
         "voice_caption": "Here is a message for you ❤️",
         "limit_reached": "🔒 **Daily Limit Reached**\n\nYou have used your 3 free hugs for today.\nWait until tomorrow or upgrade to **Premium** for unlimited support!",
         "premium_locked": "💎 This voice is Premium. Upgrade to unlock!",
+        "queue_position": "⏳ Lots of people need a hug right now. You are #{position} in line, I'll be with you soon ♡",
+        "busy": "😔 I'm overloaded right now. Please try again in a few minutes.",
         "upsell_phrase": "... I am always here. If you want more hugs - upgrade to premium ♡",
         "system_prompt": "You are a warm, supportive friend. Speak softly, kindly. Do not mention you are an AI."
     },
@@ -68,21 +191,73 @@ TEXTS = {
         "voice_caption": "Это сообщение для тебя ❤️",
         "limit_reached": "🔒 **Лимит исчерпан**\n\nТы использовал(а) все 3 бесплатных утешения на сегодня.\nПриходи завтра или перейди в **Премиум** для безлимитных обнимашек! ♡",
         "premium_locked": "💎 Этот голос доступен только в Премиум. Обнови подписку!",
+        "queue_position": "⏳ Сейчас многим нужна поддержка. Ты #{position} в очереди, скоро я буду с тобой ♡",
+        "busy": "😔 Я сейчас перегружен(а). Попробуй, пожалуйста, через пару минут.",
         "upsell_phrase": "... я всегда здесь. Если хочешь больше обнимашек — переходи в премиум ♡",
         "system_prompt": "Ты поддерживающая подруга/друг, которая обнимает и утешает голосом в стиле ASMR. Никогда не говори, что ты ИИ, бот или программа. Говори только ласково, нежно тепло и сладко. текст будет озвучиваться поэтому не говори от себя типа вот текст для этого и того. не пиши действия типа я глажу тебя или я обнимаю тебя"
     }
 }
 
 async def fetch_voices():
-    """Fetches voices from ElevenLabs on startup."""
-    global ALL_VOICES
+    """Fetch voices from ElevenLabs; on change, swap them in and save a snapshot.
+
+    Returns True if the catalog changed. Errors propagate to the caller.
+    """
+    response = await tts_client.client.voices.get_all(request_options={"timeout_in_seconds": 30})
+    if not CATALOG.load(response.voices if hasattr(response, 'voices') else response):
+        return False
+    logger.info(f"Loaded {len(CATALOG)} voices from ElevenLabs (catalog changed).")
+    await asyncio.to_thread(CATALOG.save_snapshot, VOICE_SNAPSHOT_PATH)
+    await database.invalidate_previews_async({v.voice_id: v.preview_url for v in CATALOG.voices})
+    refresh_upsell_clips()
+    return True
+
+async def refresh_voices_forever():
+    """Keep the catalog fresh; a failed fetch never takes the current one away."""
+    while True:
+        try:
+            await fetch_voices()
+            delay = VOICE_REFRESH_SECONDS
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.inc("upstream_errors_total", upstream="elevenlabs_voices")
+            # Retry soon while we have nothing to serve, otherwise wait for the next round.
+            delay = VOICE_RETRY_SECONDS if not CATALOG else VOICE_REFRESH_SECONDS
+            logger.error(f"Failed to fetch voices ({len(CATALOG)} cached, retrying in {delay:.0f}s): {e}")
+        await asyncio.sleep(delay)
+
+def upsell_clip_keys(voice_list):
+    """(voice_id, lang, phrase, fingerprint, output_format) for every voice and language."""
+    return [
+        (v.voice_id, lang, TEXTS[lang]["upsell_phrase"], v.preview_url or "", resolve_audio_format(0))
+        for v in voice_list for lang in TEXTS
+    ]
+
+def refresh_upsell_clips():
+    """Drop outdated upsell clips and pre-render the ones free users will hear."""
+    async def refresh():
+        await asyncio.to_thread(UPSELL.prune, upsell_clip_keys(CATALOG.voices))
+        await UPSELL.warm(upsell_clip_keys(v for v in CATALOG.voices if v.tier == voices.TIER_FREE))
+
+    task = asyncio.create_task(refresh())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def get_upsell_clip(voice_id: str, lang: str, output_format: str) -> bytes:
+    """Pre-rendered upsell tail for this voice and language.
+
+    Returns None if the clip can't be produced: the reply is already paid
+    for, so it goes out without the tail rather than failing.
+    """
+    voice = CATALOG.get(voice_id)
+    fingerprint = (voice.preview_url or "") if voice else ""
     try:
-        response = elevenlabs_client.voices.get_all()
-        ALL_VOICES = response.voices if hasattr(response, 'voices') else response
-        logger.info(f"Loaded {len(ALL_VOICES)} voices from ElevenLabs.")
+        return await UPSELL.get(voice_id, lang, TEXTS[lang]["upsell_phrase"], fingerprint, output_format)
     except Exception as e:
-        logger.error(f"Failed to fetch voices: {e}")
-        ALL_VOICES = []
+        metrics.inc("upsell_errors_total")
+        logger.warning(f"Sending reply without upsell clip for {voice_id}/{lang}: {e}")
+        return None
 
 def get_language_keyboard():
     """Keyboard for language selection."""
@@ -95,52 +270,15 @@ def get_language_keyboard():
     return InlineKeyboardMarkup(keyboard)
 
 def get_voice_keyboard(page: int = 0, lang: str = "en", is_premium: bool = False):
-    """Generates paginated keyboard for voices."""
-    total_pages = math.ceil(len(ALL_VOICES) / VOICES_PER_PAGE)
-    start_idx = page * VOICES_PER_PAGE
-    end_idx = start_idx + VOICES_PER_PAGE
-    current_voices = ALL_VOICES[start_idx:end_idx]
-
-    keyboard = []
-    
-    # Logic: Free users get first 2 voices as free, others are premium
-    # This is a simple heuristic. You can also match by ID.
-    
-    for i, voice in enumerate(current_voices):
-        global_index = start_idx + i
-        is_free_voice = global_index < 3 # First 3 voices are free
-        
-        lock_icon = "" if (is_premium or is_free_voice) else "💎 "
-        
-        # Button to Select Voice
-        select_btn = InlineKeyboardButton(
-            f"{lock_icon}{voice.name}", 
-            callback_data=f"select_{voice.voice_id}_{is_free_voice}"
-        )
-        # Button to Preview 
-        preview_btn = InlineKeyboardButton(
-            "📢", 
-            callback_data=f"preview_{voice.voice_id}"
-        )
-        keyboard.append([select_btn, preview_btn])
-
-    # Navigation
-    nav_row = []
-    if page > 0:
-        nav_row.append(InlineKeyboardButton("⬅️", callback_data=f"page_{page-1}"))
-    nav_row.append(InlineKeyboardButton(f"{page+1}/{total_pages}", callback_data="noop"))
-    if page < total_pages - 1:
-        nav_row.append(InlineKeyboardButton("➡️", callback_data=f"page_{page+1}"))
-    keyboard.append(nav_row)
-    
-    return InlineKeyboardMarkup(keyboard)
+    """Paginated keyboard for voices (precomputed by the catalog)."""
+    return CATALOG.keyboard(page, is_premium)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sends a welcome message and asks for language preference."""
     user = update.effective_user
-    database.add_user(user.id, user.username, user.first_name)
+    await database.add_user_async(user.id, user.username, user.first_name)
     
-    if not ALL_VOICES:
+    if not CATALOG:
         await update.message.reply_text("⏳ Loading... / Загрузка...")
         return
 
@@ -155,20 +293,19 @@ async def button_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data
     user_id = update.effective_user.id
     
-    # Get user state from DB
-    user_data = database.get_user(user_id)
-    # user_data structure: (id, username, first, lang, sub_level, msgs_today, last_date, join_date)
-    # We can rely on context.user_data for session lang, but DB is source of truth for sub
-    is_premium = False
-    if user_data and user_data[4] >= 1:
-        is_premium = True
-
-    lang = context.user_data.get("lang", "en")
+    session = await SESSIONS.get(user_id)
+    if session is None:
+        # Pressed a button from before /start (e.g. an old chat); register now.
+        user = update.effective_user
+        await database.add_user_async(user.id, user.username, user.first_name)
+        session = await SESSIONS.get(user_id)
+    is_premium = session.tier >= 1
+    lang = session.lang
 
     if data.startswith("lang_"):
         await query.answer()
         selected_lang = data.split("_")[1]
-        context.user_data["lang"] = selected_lang
+        SESSIONS.update(session, lang=selected_lang)
         
         await query.edit_message_text(
             text=TEXTS[selected_lang]["choose_voice"],
@@ -183,19 +320,17 @@ async def button_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if data.startswith("select_"):
-        parts = data.split("_")
-        voice_id = parts[1]
-        is_free_voice_btn = parts[2] == "True"
+        voice_id = data.split("_")[1]
+        voice = CATALOG.get(voice_id)
         
-        if not is_premium and not is_free_voice_btn:
+        if not is_premium and (voice is None or voice.tier != voices.TIER_FREE):
              await query.answer(TEXTS[lang]["premium_locked"], show_alert=True)
              return
 
         await query.answer()
-        voice = next((v for v in ALL_VOICES if v.voice_id == voice_id), None)
         voice_name = voice.name if voice else "Unknown"
         
-        context.user_data["voice_id"] = voice_id
+        SESSIONS.update(session, voice_id=voice_id)
         
         await query.edit_message_text(
             text=TEXTS[lang]["voice_set"].format(voice_name=voice_name),
@@ -206,15 +341,9 @@ async def button_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if data.startswith("preview_"):
         await query.answer(TEXTS[lang]["preview_sent"])
         voice_id = data.split("_")[1]
-        voice = next((v for v in ALL_VOICES if v.voice_id == voice_id), None)
-        if voice and hasattr(voice, 'preview_url') and voice.preview_url:
-            await context.bot.send_audio(
-                chat_id=update.effective_chat.id,
-                audio=voice.preview_url,
-                caption=f"Preview: {voice.name}",
-                performer="ElevenLabs",
-                title=voice.name
-            )
+        voice = CATALOG.get(voice_id)
+        if voice and voice.preview_url:
+            await send_preview(context, update.effective_chat.id, voice)
         else:
             await context.bot.send_message(chat_id=update.effective_chat.id, text=TEXTS[lang]["no_preview"])
         return
@@ -222,101 +351,448 @@ async def button_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if data == "noop":
         await query.answer()
 
+def reply_is_joined(tier: int) -> bool:
+    """Whether a reply at this level is sent as one clip joined from several.
+
+    Free replies get the upsell tail, segmented mode joins its segments and
+    single-message streaming joins its sentences; progressive streaming sends
+    every clip as its own voice message.
+    """
+    if STREAMING_TTS:
+        return STREAMING_DELIVERY != "progressive"
+    return SEGMENTED_TTS or tier < 1
+
+def resolve_audio_format(tier: int) -> str:
+    """Output format we will actually produce for a subscription level.
+
+    Without ffmpeg this falls back to plain MP3 when the profile's format
+    can't be requested from ElevenLabs (not allowed on our plan), and for
+    Opus replies joined from several clips: Opus clips could then only be
+    chained, which not every player handles, while MP3 clips join by simple
+    concatenation. A reply that is a single clip keeps its Opus format.
+    """
+    output_format = AUDIO_PROFILES.get(tier, AUDIO_PROFILES[0])
+    native = not AUDIO_TRANSCODE and output_format not in _native_format_unsupported
+    if not audio.has_ffmpeg() and (not native or (audio.is_opus(output_format) and reply_is_joined(tier))):
+        return audio.FALLBACK_FORMAT
+    return output_format
+
+async def synthesize(text: str, voice_id: str, output_format: str = audio.FALLBACK_FORMAT, timing: dict = None,
+                     **context) -> bytes:
+    """Convert text to speech with ElevenLabs and return audio in output_format.
+
+    The format is requested from ElevenLabs directly; if the plan rejects it
+    (or AUDIO_TRANSCODE is set) we request MP3 and transcode locally.
+    `context` (previous_text / next_text) is passed through to ElevenLabs;
+    `timing` is passed to the TTS client to collect upstream seconds.
+    """
+    if not AUDIO_TRANSCODE and output_format not in _native_format_unsupported:
+        try:
+            return await tts_client.convert(
+                text, voice_id, timing=timing, model_id=TTS_MODEL, output_format=output_format, **context
+            )
+        except ApiError as e:
+            if not tts.is_format_rejection(e) or output_format == audio.FALLBACK_FORMAT:
+                raise
+            logger.warning(f"ElevenLabs rejected output format {output_format} ({e.status_code}), transcoding locally from now on")
+            _native_format_unsupported.add(output_format)
+
+    data = await tts_client.convert(
+        text, voice_id, timing=timing, model_id=TTS_MODEL, output_format=audio.FALLBACK_FORMAT, **context
+    )
+    if output_format == audio.FALLBACK_FORMAT:
+        return data
+    if not audio.has_ffmpeg():
+        # Can't re-encode; Telegram takes MP3 voice notes too.
+        logger.warning(f"ffmpeg not found, sending MP3 instead of {output_format}")
+        return data
+    return await audio.transcode(data, output_format)
+
+async def synthesize_segmented(text: str, voice_id: str, output_format: str, timings: dict):
+    """Synthesize a long reply as parallel segments; returns the audio parts in order."""
+    segments = speech.split_segments(text)
+    if len(segments) < 2:
+        return [await synthesize(text, voice_id, output_format)]
+
+    async def synthesize_segment(segment, previous_text, next_text, timing):
+        context = {}
+        if previous_text:
+            context["previous_text"] = previous_text
+        if next_text:
+            context["next_text"] = next_text
+        return await synthesize(segment, voice_id, output_format, timing=timing, **context)
+
+    parts = await speech.synthesize_segments(segments, synthesize_segment, SEGMENTED_TTS_FANOUT, timings)
+    metrics.observe("stage_seconds", timings["tts_saved"], stage="tts_saved")
+    return parts
+
+UPSELL = upsell.UpsellCache(UPSELL_CACHE_DIR, synthesize, TTS_MODEL)
+
+async def complete(messages) -> str:
+    """Get the whole LLM reply in one go."""
+    with metrics.timer("llm"):
+        return await llm_router.complete(messages)
+
+async def summarize_conversation(summary, turns) -> str:
+    """Fold older conversation turns into the running summary (for MEMORY)."""
+    transcript = "\n".join(
+        f"{'User' if role == memory.USER else 'You'}: {text}" for role, text in turns
+    )
+    messages = [
+        {"role": "system", "content": (
+            "You keep short notes about a person you support emotionally. "
+            "Update the notes with the new messages. Keep names, feelings, events and "
+            "worries the person shared; drop everything else. At most 80 words, "
+            "in the language of the conversation, no preamble."
+        )},
+        {"role": "user", "content": f"Notes so far:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+    ]
+    with metrics.timer("llm_summary"):
+        return await llm_router.complete(messages)
+
+MEMORY = memory.ConversationMemory(
+    summarize_conversation,
+    max_turns=int(os.getenv("CONVERSATION_TURNS", "6")),
+    token_budget=int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1200")),
+)
+
+async def stream_completion(messages):
+    """Yield the LLM reply as it is generated."""
+    async for text in llm_router.stream(messages):
+        yield text
+
+async def send_voice(update: Update, voice: bytes, caption: str, output_format: str):
+    """Upload a voice message as a reply, timing the upload."""
+    try:
+        with metrics.timer("upload"):
+            await update.message.reply_voice(voice=voice, caption=caption)
+    except Exception:
+        metrics.inc("upstream_errors_total", upstream="telegram")
+        raise
+    audio.record_sent(output_format, len(voice))
+
+async def reply_streaming(update: Update, lang: str, messages, voice_id: str, output_format: str,
+                          upsell_clip, timings: dict):
+    """Stream the LLM reply into TTS sentence by sentence and send the audio.
+
+    upsell_clip is an optional awaitable with the audio appended at the end.
+    Returns the full reply text.
+    """
+    async def tts(sentence):
+        return await synthesize(sentence, voice_id, output_format)
+
+    sent = 0
+
+    async def send_part(clip):
+        nonlocal sent
+        caption = TEXTS[lang]["voice_caption"] if sent == 0 else None
+        await send_voice(update, clip, caption, output_format)
+        sent += 1
+
+    on_audio = send_part if STREAMING_DELIVERY == "progressive" else None
+    text, parts = await speech.stream_to_speech(stream_completion(messages), tts, on_audio, timings)
+    metrics.observe("stage_seconds", timings["llm"], stage="llm")
+    if upsell_clip is not None:
+        clip = await upsell_clip
+        if clip and on_audio is not None:
+            await on_audio(clip)
+        parts.append(clip)
+    if on_audio is None:
+        audio_bytes = await audio.join(parts, output_format)
+        await send_voice(update, audio_bytes, TEXTS[lang]["voice_caption"], output_format)
+    return text
+
+async def send_preview(context: ContextTypes.DEFAULT_TYPE, chat_id: int, voice):
+    """Send a voice preview, reusing the Telegram file_id after the first upload."""
+    file_id = await database.get_preview_file_id_async(voice.voice_id, voice.preview_url)
+    kwargs = dict(chat_id=chat_id, caption=f"Preview: {voice.name}", performer="ElevenLabs", title=voice.name)
+    if file_id:
+        try:
+            return await context.bot.send_audio(audio=file_id, **kwargs)
+        except BadRequest as e:
+            logger.warning(f"Cached preview for {voice.voice_id} rejected ({e}), re-sending from URL")
+
+    message = await context.bot.send_audio(audio=voice.preview_url, **kwargs)
+    if message.audio:
+        await database.save_preview_file_id_async(voice.voice_id, voice.preview_url, message.audio.file_id)
+    return message
+
+def message_key(update: Update):
+    return update.message.chat_id, update.message.message_id
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handles text messages."""
+    """Handles text messages (each one once, even if Telegram redelivers it)."""
     user_id = update.effective_user.id
-    user_text = update.message.text
-    lang = context.user_data.get("lang", "en")
-    
-    # 1. Check DB Limits
-    allowed = database.check_limit(user_id) # Default limit 3
-    if not allowed:
-        await update.message.reply_text(TEXTS[lang]["limit_reached"], parse_mode="Markdown")
+    if not await DEDUP.claim(*message_key(update)):
         return
 
-    # Check database for premium status
-    user_db = database.get_user(user_id)
-    is_premium = user_db and user_db[4] >= 1
+    if COALESCE_MESSAGES and user_id in _coalesced:
+        # Answered (and marked done) by the reply already in progress
+        _coalesced[user_id].append(update)
+        return
 
-    # 2. Get Voice preference
-    voice_id = context.user_data.get("voice_id")
-    if not voice_id:
-        if ALL_VOICES:
-            voice_id = ALL_VOICES[0].voice_id # Default to first free one
-        else:
-            voice_id = "21m00Tcm4TlvDq8ikWAM"
+    wait = RATE_LIMITER.check(user_id)
+    if wait:
+        session = await SESSIONS.get(user_id)
+        lang = session.lang if session else "en"
+        await update.message.reply_text(TEXTS[lang]["wait_msg"].format(remaining=math.ceil(wait)))
+        await DEDUP.finish(*message_key(update))
+        return
 
-    await update.message.reply_chat_action(action="record_voice")
+    if not COALESCE_MESSAGES:
+        try:
+            await generate_reply(update, context, update.message.text)
+        except Exception:
+            await fail_messages([update])
+            raise
+        await DEDUP.finish(*message_key(update))
+        return
 
+    _coalesced[user_id] = []
+    batch = [update]  # messages the reply being generated answers
+    text = update.message.text
     try:
-        # 3. Generate Text
-        system_instruction = TEXTS[lang]["system_prompt"]
-        if lang == "ru":
-             user_prompt = (
-                f"Сгенерируй теплое, эмпатичное, ласковое ответное сообщение на русском языке, "
-                f"как близкий друг утешает того, кому грустно из-за: '{user_text}'. "
-                f"Длина текста 1-2 минуты для озвучки (примерно 150-200 слов), позитивно и поддерживающе."
-            )
-        else:
-            user_prompt = (
-                f"Generate a warm, empathetic, affectionate response in English, "
-                f"like a close friend comforting someone who's sad about: '{user_text}'. "
-                f"Keep it 1-2 minutes long for spoken text (approx 150-200 words), positive and uplifting."
-            )
+        while batch:
+            await generate_reply(batch[-1], context, text)
+            for answered in batch:
+                await DEDUP.finish(*message_key(answered))
+            batch, _coalesced[user_id] = _coalesced[user_id], []
+            if batch:
+                # One follow-up for everything sent in the meantime, answering the
+                # latest message. It still has to fit in the rate limit.
+                wait = RATE_LIMITER.check(user_id)
+                if wait:
+                    await asyncio.sleep(wait)
+                    RATE_LIMITER.check(user_id)
+                    batch += _coalesced[user_id]
+                    _coalesced[user_id] = []
+                text = "\n".join(u.message.text for u in batch)
+    except Exception:
+        # Follow-ups queued behind a failed reply would otherwise get no answer
+        await fail_messages(batch + _coalesced[user_id])
+        raise
+    finally:
+        del _coalesced[user_id]
+
+async def fail_messages(updates):
+    """Answer messages whose reply failed with an error, once, and close their claims."""
+    if not updates:
+        return
+    try:
+        session = await SESSIONS.get(updates[-1].effective_user.id)
+        lang = session.lang if session else "en"
+        await updates[-1].message.reply_text(TEXTS[lang]["error_processing"])
+    except Exception as e:
+        logger.error(f"Could not report a failed reply: {e}")
+    for failed in updates:
+        try:
+            await DEDUP.finish(*message_key(failed))
+        except Exception as e:
+            logger.error(f"Could not mark message {failed.message.message_id} done: {e}")
+
+async def generate_reply(update: Update, context: ContextTypes.DEFAULT_TYPE, user_text: str):
+    """Generates and sends one voice reply to user_text."""
+    user_id = update.effective_user.id
 
-        gpt_response = await openai_client.chat.completions.create(
-            model="xiaomi/mimo-v2-flash:free",
-            extra_body={"HTTP-Referer": "https://telegram.bot", "X-Title": "Emotional Support Bot"},
-            messages=[
-                {"role": "system", "content": system_instruction},
-                {"role": "user", "content": user_prompt}
-            ]
+    # 1. Reserve a slot in the daily quota (from the cached session)
+    with metrics.timer("db_quota"):
+        session = await SESSIONS.get(user_id)
+    lang = session.lang if session else "en"
+    if session is None or not SESSIONS.reserve(session, FREE_DAILY_LIMIT):
+        await update.message.reply_text(TEXTS[lang]["limit_reached"], parse_mode="Markdown")
+        return
+    is_premium = session.tier >= 1
+    output_format = resolve_audio_format(session.tier)
+
+    # 2. Get Voice preference
+    voice_id = session.voice_id
+    if not voice_id or (CATALOG and not CATALOG.get(voice_id)):
+        # Default to first free one (also if the saved voice was removed)
+        voice_id = CATALOG.default_voice_id() or "21m00Tcm4TlvDq8ikWAM"
+
+    # 3. Generate Text
+    system_instruction = TEXTS[lang]["system_prompt"]
+    if lang == "ru":
+         user_prompt = (
+            f"Сгенерируй теплое, эмпатичное, ласковое ответное сообщение на русском языке, "
+            f"как близкий друг утешает того, кому грустно из-за: '{user_text}'. "
+            f"Длина текста 1-2 минуты для озвучки (примерно 150-200 слов), позитивно и поддерживающе."
+        )
+    else:
+        user_prompt = (
+            f"Generate a warm, empathetic, affectionate response in English, "
+            f"like a close friend comforting someone who's sad about: '{user_text}'. "
+            f"Keep it 1-2 minutes long for spoken text (approx 150-200 words), positive and uplifting."
         )
-        supportive_text = gpt_response.choices[0].message.content
-        
-        # 4. Upsell appending (For Free users only)
-        if not is_premium:
-            upsell = TEXTS[lang]["upsell_phrase"]
-            supportive_text += f"\n\n{upsell}"
-
-        # 5. Generate Audio
-        def generate_audio():
-            return elevenlabs_client.text_to_speech.convert(
-                text=supportive_text,
-                voice_id=voice_id,
-                model_id="eleven_multilingual_v2"
-            )
 
-        audio_iterator = await asyncio.get_event_loop().run_in_executor(None, generate_audio)
-        audio_bytes = b"".join(audio_iterator)
+    # Recent turns and a summary of older ones, within a fixed token budget
+    try:
+        conversation = await MEMORY.get(user_id)
+    except Exception as e:
+        logger.error(f"Failed to load conversation of {user_id}: {e}")
+        SESSIONS.refund(session)
+        await update.message.reply_text(TEXTS[lang]["error_processing"])
+        return
+    messages = MEMORY.prompt(conversation, system_instruction, user_prompt)
 
-        # 6. Send Voice
-        await update.message.reply_voice(voice=audio_bytes, caption=TEXTS[lang]["voice_caption"])
-        
-        # 7. Increment Usage
-        database.increment_usage(user_id)
+    # Premium jobs are served first; a full lane sheds the request.
+    lane = scheduler.LANE_PREMIUM if is_premium else scheduler.LANE_FREE
+    try:
+        job = SCHEDULER.submit(lane, lambda: produce_reply(update, lang, messages, voice_id, output_format, is_premium))
+    except scheduler.QueueFull as e:
+        logger.warning(f"Shedding message from {user_id}: {e}")
+        SESSIONS.refund(session)
+        await update.message.reply_text(TEXTS[lang]["busy"])
+        return
+
+    # Only cosmetic; the job is already queued and will send its reply anyway.
+    try:
+        if SHOW_QUEUE_POSITION and job.position > 0:
+            await update.message.reply_text(TEXTS[lang]["queue_position"].format(position=job.position))
+        await update.message.reply_chat_action(action="record_voice")
+    except Exception as e:
+        logger.warning(f"Could not show progress to {user_id}: {e}")
 
+    try:
+        reply_text = await job
     except Exception as e:
         logger.error(f"Error processing message: {e}")
+        SESSIONS.refund(session)
         await update.message.reply_text(TEXTS[lang]["error_processing"])
+        return
 
-async def post_init(application):
-    await fetch_voices()
-    database.init_db()
+    try:
+        await MEMORY.add_exchange(conversation, user_text, reply_text)
+    except Exception as e:
+        # The reply is already sent; only the history misses this exchange.
+        metrics.inc("conversation_save_errors_total")
+        logger.error(f"Failed to save conversation of {user_id}: {e}")
+
+async def produce_reply(update: Update, lang: str, messages, voice_id: str, output_format: str, is_premium: bool):
+    """LLM + TTS + upload for one reply; returns the reply text. Runs on a scheduler worker."""
+    # 4. Upsell tail (For Free users only): a pre-rendered clip, fetched in
+    # parallel and joined onto the speech so only the unique text hits TTS
+    upsell_clip = None
+    if not is_premium:
+        upsell_clip = asyncio.create_task(get_upsell_clip(voice_id, lang, output_format))
+
+    started = time.monotonic()
+    timings = {}
+    try:
+        if STREAMING_TTS:
+            reply_text = await reply_streaming(update, lang, messages, voice_id, output_format, upsell_clip, timings)
+        else:
+            supportive_text = reply_text = await complete(messages)
+            timings["llm"] = time.monotonic() - started
+
+            # 5. Generate Audio
+            with metrics.timer("tts"):
+                if SEGMENTED_TTS:
+                    parts = await synthesize_segmented(supportive_text, voice_id, output_format, timings)
+                else:
+                    parts = [await synthesize(supportive_text, voice_id, output_format)]
+            if upsell_clip is not None:
+                parts.append(await upsell_clip)
+            audio_bytes = await audio.join(parts, output_format)
+            timings["tts_done"] = time.monotonic() - started
+
+            # 6. Send Voice
+            await send_voice(update, audio_bytes, TEXTS[lang]["voice_caption"], output_format)
+    except BaseException:
+        if upsell_clip is not None:
+            upsell_clip.cancel()
+        raise
+    timings["total"] = time.monotonic() - started
+    metrics.observe("stage_seconds", timings["total"], stage="total")
+    if "first_audio" in timings:
+        metrics.observe("stage_seconds", timings["first_audio"], stage="first_audio")
+    logger.info(
+        f"Reply timings ({'streaming' if STREAMING_TTS else 'segmented' if SEGMENTED_TTS else 'sequential'}): "
+        + ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items())
+    )
+    return reply_text
 
-if __name__ == '__main__':
-    if not TELEGRAM_TOKEN or not OPENROUTER_API_KEY or not ELEVENLABS_API_KEY:
-        print("❌ Error: Missing API Keys.")
-        exit(1)
+async def post_init(application):
+    if not audio.has_ffmpeg() and any(audio.is_opus(f) for f in AUDIO_PROFILES.values()):
+        logger.warning("ffmpeg not found: Opus replies joined from several clips fall back to MP3")
+    if WORKER_PROCESSES > TTS_MAX_CONCURRENCY:
+        logger.warning(f"{WORKER_PROCESSES} workers with TTS_MAX_CONCURRENCY={TTS_MAX_CONCURRENCY}: "
+                       f"each worker still runs one TTS request, up to {WORKER_PROCESSES} at once")
+    await database.init_db_async()
+    SCHEDULER.start()
+    SESSIONS.start()
+    DEDUP.start()
+    if METRICS_PORT:
+        metrics.start_http_server(int(METRICS_PORT) + int(os.getenv("WORKER_INDEX", "0")))
+    if await asyncio.to_thread(CATALOG.load_snapshot, VOICE_SNAPSHOT_PATH):
+        logger.info(f"Loaded {len(CATALOG)} voices from snapshot {VOICE_SNAPSHOT_PATH}.")
+        refresh_upsell_clips()
+    application.bot_data["voice_refresh"] = asyncio.create_task(refresh_voices_forever())
+    # Only the process serving the admin picks up a broadcast interrupted by
+    # a restart, so /broadcast_cancel reaches it. Updates are sharded by
+    # sender, and in the admin's private chat the chat id is the user id.
+    worker_index = int(os.getenv("WORKER_INDEX", "0"))
+    await admin.BROADCASTER.resume(
+        application.bot, owns=lambda chat_id: webhook.worker_for(chat_id, WORKER_PROCESSES) == worker_index
+    )
 
-    application = ApplicationBuilder().token(TELEGRAM_TOKEN).post_init(post_init).build()
+async def post_shutdown(application):
+    refresher = application.bot_data.get("voice_refresh")
+    if refresher:
+        refresher.cancel()
+    await admin.BROADCASTER.stop()
+    await SCHEDULER.stop()
+    await SESSIONS.stop()
+    await MEMORY.stop()
+    await DEDUP.stop()
+    await tts_client.close()
+    await database.run(database.close)
+
+def build_application(updater: bool = True):
+    """Create the Application with all handlers registered."""
+    builder = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(True)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        # e.g. a local Bot API server or fake_telegram.py for testing
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    if not updater:
+        builder = builder.updater(None)
+    application = builder.build()
+    application.bot_data["sessions"] = SESSIONS
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("admin", admin.admin_start))
     application.add_handler(CommandHandler("add_premium", admin.add_premium))
     application.add_handler(CommandHandler("remove_premium", admin.remove_premium))
+    application.add_handler(CommandHandler("broadcast", admin.start_broadcast))
+    application.add_handler(CommandHandler("broadcast_cancel", admin.cancel_broadcast))
     application.add_handler(CallbackQueryHandler(button_click))
     application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message))
+    return application
 
-    print("🤖 Bot is running...")
-    application.run_polling()
+if __name__ == '__main__':
+    if not TELEGRAM_TOKEN or not OPENROUTER_API_KEY or not ELEVENLABS_API_KEY:
+        print("❌ Error: Missing API Keys.")
+        exit(1)
+
+    if SERVE_MODE == "webhook":
+        print(f"🤖 Bot is running (webhook, {WEBHOOK_WORKERS} workers)...")
+        webhook.serve(
+            build_application,
+            token=TELEGRAM_TOKEN,
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            path=WEBHOOK_PATH,
+            secret=WEBHOOK_SECRET,
+            webhook_url=WEBHOOK_URL,
+            workers=WEBHOOK_WORKERS,
+            base_url=TELEGRAM_API_URL,
+        )
+    else:
+        print("🤖 Bot is running...")
+        build_application().run_polling()
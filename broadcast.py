@@ -0,0 +1,230 @@
+import time
+import asyncio
+import datetime
+import logging
+
+from telegram.error import RetryAfter, Forbidden, BadRequest, NetworkError
+
+import database
+import metrics
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# BadRequest messages that mean the chat is gone for good.
+UNREACHABLE_ERRORS = ("chat not found", "user is deactivated", "bot was blocked", "peer_id_invalid")
+
+SENT, FAILED, UNREACHABLE = "sent", "failed", "unreachable"
+
+class Broadcaster:
+    """Send one text to every reachable user, within Telegram's global limit.
+
+    Recipients are read from SQLite in pages of `page_size` user ids. Every
+    send takes a token from one shared bucket refilled at `rate` msg/s. A
+    RetryAfter pauses all sends for the requested time and halves the rate;
+    each success then raises it slowly back to `rate` (additive increase,
+    multiplicative decrease). Progress is checkpointed after each page, so a
+    crashed broadcast resumes where it stopped and resends at most one page.
+    The status is re-read from the DB at every checkpoint, so a cancel issued
+    in another process (webhook worker) stops the sender too.
+    """
+
+    def __init__(self, rate: float = 25.0, page_size: int = 200, min_rate: float = 1.0,
+                 max_attempts: int = 3, report_every: float = 15.0, clock=time.monotonic):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.page_size = page_size
+        self.max_attempts = max_attempts
+        self.report_every = report_every
+        self.clock = clock
+        self._bucket = TokenBucket(1, rate, clock())
+        self._paused_until = 0.0
+        self._acquire_lock = asyncio.Lock()
+        self._task = None
+        self._cancelled = False
+        self.progress = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self, bot, text: str, admin_chat_id: int) -> int:
+        """Start a new broadcast in the background and return its id."""
+        if self.running:
+            raise RuntimeError("a broadcast is already running")
+        if await database.get_running_broadcast_async() is not None:
+            raise RuntimeError("an unfinished broadcast exists; cancel it first")
+        broadcast_id = await database.create_broadcast_async(text, admin_chat_id)
+        self._launch(bot, {
+            'id': broadcast_id, 'text': text, 'admin_chat_id': admin_chat_id,
+            'last_user_id': 0, 'sent': 0, 'failed': 0, 'unreachable': 0,
+        })
+        return broadcast_id
+
+    async def resume(self, bot, owns=None):
+        """Continue a broadcast left running by a previous process, if any.
+
+        `owns` is an optional callable admin_chat_id -> bool; with several
+        processes only the one serving the admin's chat resumes, so the
+        admin's /broadcast and /broadcast_cancel reach the sender.
+        """
+        if self.running:
+            return None
+        job = await database.get_running_broadcast_async()
+        if job is not None and owns is not None and not owns(job['admin_chat_id']):
+            return None
+        if job is not None:
+            logger.info(f"Resuming broadcast #{job['id']} after user {job['last_user_id']}")
+            self._launch(bot, job)
+        return job
+
+    async def cancel(self):
+        """Stop the unfinished broadcast for good (it won't be resumed).
+
+        Returns its id, or None if there was nothing to cancel.
+        """
+        if self.running:
+            self._cancelled = True
+            broadcast_id = self.progress['id']
+        else:
+            # Sent by another process, or left over by a crashed one; the
+            # sender sees the new status at its next checkpoint.
+            job = await database.get_running_broadcast_async()
+            if job is None:
+                return None
+            broadcast_id = job['id']
+        await database.finish_broadcast_async(broadcast_id, 'cancelled')
+        return broadcast_id
+
+    async def stop(self):
+        """Stop sending on shutdown; the broadcast stays resumable."""
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def _launch(self, bot, job):
+        self._cancelled = False
+        self._task = asyncio.create_task(self._run(bot, job))
+
+    async def _acquire(self):
+        """Wait for a send slot under the global rate and any flood pause."""
+        async with self._acquire_lock:  # one waiter polls the bucket at a time
+            while True:
+                now = self.clock()
+                wait = self._paused_until - now
+                if wait <= 0:
+                    wait = self._bucket.take(now)
+                    if wait <= 0:
+                        return
+                await asyncio.sleep(wait)
+
+    def _set_rate(self, rate: float):
+        self._bucket.take(self.clock(), 0)  # settle tokens at the old rate
+        self._bucket.rate = rate
+
+    def _on_flood(self, retry_after):
+        if isinstance(retry_after, datetime.timedelta):
+            retry_after = retry_after.total_seconds()
+        self._paused_until = max(self._paused_until, self.clock() + retry_after)
+        self._set_rate(max(self.min_rate, self._bucket.rate / 2))
+        metrics.inc("broadcast_flood_waits_total")
+        logger.warning(f"Broadcast flood wait {retry_after}s, rate lowered to {self._bucket.rate:.1f} msg/s")
+
+    def _on_success(self):
+        if self._bucket.rate < self.max_rate:
+            self._set_rate(min(self.max_rate, self._bucket.rate + 0.1))
+
+    async def _deliver(self, bot, user_id: int, text: str) -> str:
+        attempts = 0
+        while True:
+            await self._acquire()
+            try:
+                await bot.send_message(user_id, text)
+            except RetryAfter as e:
+                self._on_flood(e.retry_after)  # doesn't count as an attempt
+                continue
+            except Forbidden:
+                return UNREACHABLE
+            except BadRequest as e:
+                if any(marker in str(e).lower() for marker in UNREACHABLE_ERRORS):
+                    return UNREACHABLE
+                logger.warning(f"Broadcast to {user_id} failed: {e}")
+                return FAILED
+            except NetworkError as e:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    logger.warning(f"Broadcast to {user_id} failed: {e}")
+                    return FAILED
+                await asyncio.sleep(2 ** attempts)
+                continue
+            self._on_success()
+            return SENT
+
+    def _report(self, job, started, sent_at_start, final=None):
+        sent = job['sent'] - sent_at_start
+        elapsed = max(self.clock() - started, 1e-9)
+        header = f"📣 Broadcast #{job['id']}" + (f" {final}" if final else " in progress")
+        return (
+            f"{header}\n"
+            f"✅ Sent: {job['sent']}\n"
+            f"🚫 Unreachable: {job['unreachable']}\n"
+            f"⚠️ Failed: {job['failed']}\n"
+            f"⚡ {sent / elapsed:.1f} msg/s (limit {self._bucket.rate:.1f}/s)"
+        )
+
+    async def _update_status(self, bot, job, message, text):
+        try:
+            if message is None:
+                return await bot.send_message(job['admin_chat_id'], text)
+            await message.edit_text(text)
+        except Exception as e:
+            logger.warning(f"Could not update broadcast status: {e}")
+        return message
+
+    async def _run(self, bot, job):
+        self.progress = job
+        started = self.clock()
+        last_report = started
+        sent_at_start = job['sent']
+        status_message = await self._update_status(bot, job, None, self._report(job, started, sent_at_start))
+        outcome = "done"
+        try:
+            while True:
+                if self._cancelled:
+                    outcome = "cancelled"
+                    break
+                user_ids = await database.get_broadcast_recipients_async(job['last_user_id'], self.page_size)
+                if not user_ids:
+                    break
+                results = await asyncio.gather(*(self._deliver(bot, user_id, job['text']) for user_id in user_ids))
+                unreachable = [user_id for user_id, result in zip(user_ids, results) if result == UNREACHABLE]
+                job['last_user_id'] = user_ids[-1]
+                job['sent'] += results.count(SENT)
+                job['failed'] += results.count(FAILED)
+                job['unreachable'] += len(unreachable)
+                for result in (SENT, FAILED, UNREACHABLE):
+                    metrics.inc("broadcast_messages_total", results.count(result), outcome=result)
+                await database.checkpoint_broadcast_async(
+                    job['id'], job['last_user_id'], job['sent'], job['failed'], unreachable
+                )
+                status = await database.get_broadcast_status_async(job['id'])
+                if status != 'running':
+                    outcome = status or "cancelled"
+                    break
+                if self.clock() - last_report >= self.report_every:
+                    last_report = self.clock()
+                    await self._update_status(bot, job, status_message, self._report(job, started, sent_at_start))
+            await database.finish_broadcast_async(job['id'], outcome)
+        except asyncio.CancelledError:
+            logger.info(f"Broadcast #{job['id']} interrupted after user {job['last_user_id']}; will resume")
+            raise
+        except Exception:
+            logger.exception(f"Broadcast #{job['id']} crashed after user {job['last_user_id']}; will resume on restart")
+            await self._update_status(bot, job, status_message, self._report(job, started, sent_at_start, "crashed"))
+            return
+        logger.info(f"Broadcast #{job['id']} {outcome}: {job['sent']} sent, {job['unreachable']} unreachable, "
+                    f"{job['failed']} failed in {self.clock() - started:.0f}s")
+        await self._update_status(bot, job, status_message, self._report(job, started, sent_at_start, outcome))
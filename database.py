@@ -1,15 +1,76 @@
+import os
+import zlib
+import time
 import sqlite3
 import datetime
 import logging
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-DB_NAME = "bot.db"
+import metrics
+
+DB_NAME = os.getenv("DATABASE_PATH", "bot.db")
+BUSY_TIMEOUT_MS = 5000
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# One long-lived connection, owned by a single dedicated thread.
+# All async callers go through _executor, so queries are serialized on that
+# thread and the event loop never waits on disk I/O.
+_conn = None
+_conn_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+def get_connection():
+    """Return the shared connection, opening it with tuned pragmas on first use."""
+    global _conn
+    with _conn_lock:
+        if _conn is None:
+            conn = sqlite3.connect(DB_NAME, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            conn.execute('PRAGMA cache_size=-8000')  # ~8 MB page cache
+            _conn = conn
+        return _conn
+
+def close():
+    """Close the shared connection (e.g. on shutdown)."""
+    global _conn
+    with _conn_lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+
+async def run(func, *args, **kwargs):
+    """Run a blocking database function on the dedicated database thread.
+
+    Records how long the call queued behind others (db_wait) and how long the
+    query itself took (db_query); "database is locked" errors are counted.
+    """
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
+
+    def call():
+        started = time.perf_counter()
+        metrics.observe("db_seconds", started - submitted, phase="wait")
+        try:
+            return func(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e) or "busy" in str(e):
+                metrics.inc("db_busy_errors_total")
+            raise
+        finally:
+            metrics.observe("db_seconds", time.perf_counter() - started, phase="query")
+
+    return await loop.run_in_executor(_executor, call)
+
 def init_db():
     """Initialize the database tables."""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     
     # Users table
@@ -26,93 +87,454 @@ def init_db():
             join_date DATE
         )
     ''')
+
+    # Telegram file_id of each voice preview we already uploaded, so repeated
+    # taps reuse it instead of Telegram re-downloading preview_url.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS voice_previews (
+            voice_id TEXT PRIMARY KEY,
+            preview_url TEXT NOT NULL,
+            file_id TEXT NOT NULL
+        )
+    ''')
+
+    # unreachable: 1 once Telegram says the user blocked the bot or the chat is
+    # gone; broadcasts skip them until they talk to the bot again.
+    _add_column(cursor, 'users', 'unreachable', 'INTEGER NOT NULL DEFAULT 0')
+    # Selected voice; NULL = the catalog's default voice.
+    _add_column(cursor, 'users', 'voice_id', 'TEXT')
+
+    # Admin broadcasts; last_user_id is the checkpoint a crashed run resumes from.
+    # status: 'running', 'done' or 'cancelled'
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            admin_chat_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            unreachable INTEGER NOT NULL DEFAULT 0,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+
+    # Messages already being answered or answered, to drop redelivered updates.
+    # done: 0 = in flight, 1 = answered; updated_at: unix seconds
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS processed_updates (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Conversation memory: turns not yet folded into the summary.
+    # role: 0 = user, 1 = assistant; text: zlib-compressed UTF-8
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_turns (
+            user_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            role INTEGER NOT NULL,
+            text BLOB NOT NULL,
+            PRIMARY KEY (user_id, seq)
+        ) WITHOUT ROWID
+    ''')
+    # Running summary of all turns up to through_seq
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            user_id INTEGER PRIMARY KEY,
+            summary TEXT NOT NULL,
+            through_seq INTEGER NOT NULL
+        )
+    ''')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_subscription ON users (subscription_level)')
+    _init_stats(cursor)
     conn.commit()
-    conn.close()
     logger.info("Database initialized.")
 
+def _add_column(cursor, table, column, declaration):
+    """Add a column to an existing table unless it is already there."""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+def _init_stats(cursor):
+    """Create the counter tables and the triggers that keep them current.
+
+    The admin panel reads these rows instead of scanning users, so its cost
+    does not grow with the user base. Counters are seeded from users once,
+    when the table is first created on an existing database.
+    """
+    # stats: running totals ('users', 'premium_users')
+    # daily_stats: per-day active users, generated messages and sign-ups
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day DATE PRIMARY KEY,
+            active_users INTEGER NOT NULL DEFAULT 0,
+            messages INTEGER NOT NULL DEFAULT 0,
+            new_users INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS stats_user_insert AFTER INSERT ON users
+        BEGIN
+            UPDATE stats SET value = value + 1 WHERE name = 'users';
+            UPDATE stats SET value = value + 1 WHERE name = 'premium_users' AND NEW.subscription_level > 0;
+            INSERT OR IGNORE INTO daily_stats (day) VALUES (NEW.join_date);
+            UPDATE daily_stats SET new_users = new_users + 1 WHERE day = NEW.join_date;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS stats_user_delete AFTER DELETE ON users
+        BEGIN
+            UPDATE stats SET value = value - 1 WHERE name = 'users';
+            UPDATE stats SET value = value - 1 WHERE name = 'premium_users' AND OLD.subscription_level > 0;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS stats_user_subscription AFTER UPDATE OF subscription_level ON users
+        WHEN (OLD.subscription_level > 0) != (NEW.subscription_level > 0)
+        BEGIN
+            UPDATE stats SET value = value + (CASE WHEN NEW.subscription_level > 0 THEN 1 ELSE -1 END)
+            WHERE name = 'premium_users';
+        END
+    ''')
+    # save_sessions moves last_message_date to today after the first message
+    # of the day (an active user) and raises or lowers messages_today.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS stats_user_activity AFTER UPDATE OF messages_today, last_message_date ON users
+        WHEN NEW.last_message_date IS NOT NULL
+        BEGIN
+            INSERT OR IGNORE INTO daily_stats (day) VALUES (NEW.last_message_date);
+            UPDATE daily_stats SET
+                active_users = active_users + (OLD.last_message_date IS NOT NEW.last_message_date),
+                messages = messages + NEW.messages_today
+                    - (CASE WHEN OLD.last_message_date IS NEW.last_message_date THEN OLD.messages_today ELSE 0 END)
+            WHERE day = NEW.last_message_date;
+        END
+    ''')
+
+    # Seed counters for databases created before the stats tables existed.
+    cursor.execute('''
+        INSERT OR IGNORE INTO stats (name, value)
+        SELECT 'users', COUNT(*) FROM users
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO stats (name, value)
+        SELECT 'premium_users', COUNT(*) FROM users WHERE subscription_level > 0
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO daily_stats (day, active_users, messages)
+        SELECT last_message_date, COUNT(*), SUM(messages_today) FROM users
+        WHERE last_message_date = ? AND messages_today > 0
+    ''', (str(datetime.date.today()),))
+
 def get_user(user_id):
     """Get user details."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
     cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-    user = cursor.fetchone()
-    conn.close()
-    return user
+    return cursor.fetchone()
 
 def add_user(user_id, username, first_name):
     """Add a new user if not exists."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    conn = get_connection()
     try:
-        cursor.execute('''
-            INSERT OR IGNORE INTO users (user_id, username, first_name, join_date, last_message_date)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, username, first_name, datetime.date.today(), datetime.date.today()))
+        conn.execute('''
+            INSERT OR IGNORE INTO users (user_id, username, first_name, join_date)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, username, first_name, str(datetime.date.today())))
+        # A user who comes back (e.g. unblocked the bot) is reachable again.
+        conn.execute('UPDATE users SET unreachable = 0 WHERE user_id = ? AND unreachable = 1', (user_id,))
         conn.commit()
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error adding user: {e}")
-    finally:
-        conn.close()
 
-def check_limit(user_id, limit=3):
-    """Check if user has reached daily limit. Resets count if new day."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    today = datetime.date.today()
-    cursor.execute('SELECT messages_today, last_message_date, subscription_level FROM users WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
-    
-    if not result:
-        conn.close()
-        return False # User should start flow to be added
-        
-    count, last_date_str, sub_level = result
-    
-    # Convert string date to object if needed (sqlite stores as string usually)
-    # But python sqlite3 adapter often handles this if strictly typed, but here robust check:
-    if str(today) != str(last_date_str):
-        # New day, reset
-        cursor.execute('UPDATE users SET messages_today = 0, last_message_date = ? WHERE user_id = ?', (today, user_id))
-        conn.commit()
-        conn.close()
-        return True
-    
-    # Check limit (Premium = 1 is unlimited)
-    if sub_level >= 1:
-        conn.close()
-        return True
-        
-    if count < limit:
-        conn.close()
-        return True
-        
-    conn.close()
-    return False
-
-def increment_usage(user_id):
-    """Increment message count for today."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET messages_today = messages_today + 1 WHERE user_id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+def load_session(user_id):
+    """Return (language, voice_id, subscription_level, messages_today, last_message_date), or None."""
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT language, voice_id, subscription_level, messages_today, last_message_date
+        FROM users WHERE user_id = ?
+    ''', (user_id,))
+    return cursor.fetchone()
+
+def get_subscription(user_id):
+    """Return the user's subscription level, or None if unknown."""
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT subscription_level FROM users WHERE user_id = ?', (user_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def save_sessions(rows):
+    """Write back cached sessions in one transaction.
+
+    rows: (language, voice_id, messages_today, last_message_date, user_id) tuples.
+    """
+    conn = get_connection()
+    with conn:
+        conn.executemany('''
+            UPDATE users SET language = ?, voice_id = ?, messages_today = ?, last_message_date = ?
+            WHERE user_id = ?
+        ''', rows)
 
 def set_subscription(user_id, level):
     """Set subscription level (0=Free, 1=Premium)."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET subscription_level = ? WHERE user_id = ?', (level, user_id))
+    conn = get_connection()
+    conn.execute('UPDATE users SET subscription_level = ? WHERE user_id = ?', (level, user_id))
     conn.commit()
-    conn.close()
 
-def get_stats():
-    """Return basic stats."""
-    conn = sqlite3.connect(DB_NAME)
+def get_preview_file_id(voice_id, preview_url):
+    """Return the cached Telegram file_id for a voice preview, if still valid."""
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT file_id FROM voice_previews WHERE voice_id = ? AND preview_url = ?', (voice_id, preview_url))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def save_preview_file_id(voice_id, preview_url, file_id):
+    """Remember the Telegram file_id of an uploaded voice preview."""
+    conn = get_connection()
+    conn.execute('INSERT OR REPLACE INTO voice_previews (voice_id, preview_url, file_id) VALUES (?, ?, ?)',
+                 (voice_id, preview_url, file_id))
+    conn.commit()
+
+def invalidate_previews(preview_urls):
+    """Drop cached previews whose voice is gone or whose preview_url changed.
+
+    preview_urls: dict of voice_id -> current preview_url.
+    """
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM users')
-    total_users = cursor.fetchone()[0]
-    cursor.execute('SELECT COUNT(*) FROM users WHERE subscription_level > 0')
-    premium_users = cursor.fetchone()[0]
-    conn.close()
-    return total_users, premium_users
+    cursor.execute('SELECT voice_id, preview_url FROM voice_previews')
+    stale = [(voice_id,) for voice_id, url in cursor.fetchall() if preview_urls.get(voice_id) != url]
+    if stale:
+        cursor.executemany('DELETE FROM voice_previews WHERE voice_id = ?', stale)
+        conn.commit()
+        logger.info(f"Invalidated {len(stale)} cached voice previews.")
+    return len(stale)
+
+def get_stats():
+    """Return admin stats from the counter tables (constant time)."""
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT name, value FROM stats')
+    totals = dict(cursor.fetchall())
+    cursor.execute('SELECT active_users, messages, new_users FROM daily_stats WHERE day = ?',
+                   (str(datetime.date.today()),))
+    active_users, messages, new_users = cursor.fetchone() or (0, 0, 0)
+    total_users = totals.get('users', 0)
+    premium_users = totals.get('premium_users', 0)
+    return {
+        "total_users": total_users,
+        "premium_users": premium_users,
+        "premium_conversion": premium_users / total_users if total_users else 0.0,
+        "active_today": active_users,
+        "messages_today": messages,
+        "new_today": new_users,
+    }
+
+def create_broadcast(text, admin_chat_id):
+    """Record a new broadcast and return its id."""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute('INSERT INTO broadcasts (text, admin_chat_id) VALUES (?, ?)', (text, admin_chat_id))
+    return cursor.lastrowid
+
+def get_running_broadcast():
+    """Return the unfinished broadcast as a dict, or None."""
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT id, text, admin_chat_id, last_user_id, sent, failed, unreachable
+        FROM broadcasts WHERE status = 'running' ORDER BY id LIMIT 1
+    ''')
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip(('id', 'text', 'admin_chat_id', 'last_user_id', 'sent', 'failed', 'unreachable'), row))
+
+def get_broadcast_recipients(after_user_id, limit):
+    """Return the next page of reachable user ids, in user_id order."""
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT user_id FROM users
+        WHERE user_id > ? AND unreachable = 0
+        ORDER BY user_id LIMIT ?
+    ''', (after_user_id, limit))
+    return [row[0] for row in cursor.fetchall()]
+
+def checkpoint_broadcast(broadcast_id, last_user_id, sent, failed, unreachable_ids):
+    """Persist progress after a page and flag users that can't be reached."""
+    conn = get_connection()
+    with conn:
+        if unreachable_ids:
+            conn.executemany('UPDATE users SET unreachable = 1 WHERE user_id = ?',
+                             [(user_id,) for user_id in unreachable_ids])
+        conn.execute('''
+            UPDATE broadcasts SET last_user_id = ?, sent = ?, failed = ?, unreachable = unreachable + ?
+            WHERE id = ?
+        ''', (last_user_id, sent, failed, len(unreachable_ids), broadcast_id))
+
+def finish_broadcast(broadcast_id, status='done'):
+    """Mark a running broadcast as finished ('done' or 'cancelled').
+
+    A broadcast that is already finished keeps its status, so a sender that
+    completes after a cancel from another process can't overwrite it.
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute('''
+            UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'running'
+        ''', (status, broadcast_id))
+
+def get_broadcast_status(broadcast_id):
+    """Return the broadcast's status ('running', 'done', 'cancelled'), or None."""
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT status FROM broadcasts WHERE id = ?', (broadcast_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def claim_update(chat_id, message_id, stale_before):
+    """Claim a message for processing. Returns False if it is done or in flight.
+
+    A claim still in flight since before stale_before (unix seconds) was left
+    by a crashed process and is taken over.
+    """
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute('''
+            INSERT INTO processed_updates (chat_id, message_id, done, updated_at) VALUES (?, ?, 0, ?)
+            ON CONFLICT (chat_id, message_id) DO UPDATE SET updated_at = excluded.updated_at
+            WHERE done = 0 AND updated_at < ?
+        ''', (chat_id, message_id, int(time.time()), stale_before))
+    return cursor.rowcount > 0
+
+def finish_update(chat_id, message_id):
+    """Mark a claimed message as answered."""
+    conn = get_connection()
+    with conn:
+        conn.execute('UPDATE processed_updates SET done = 1, updated_at = ? WHERE chat_id = ? AND message_id = ?',
+                     (int(time.time()), chat_id, message_id))
+
+def release_updates(keys):
+    """Drop unfinished claims ((chat_id, message_id) pairs) so they can be processed again."""
+    conn = get_connection()
+    with conn:
+        conn.executemany('DELETE FROM processed_updates WHERE chat_id = ? AND message_id = ? AND done = 0', keys)
+
+def prune_updates(older_than):
+    """Forget messages handled before older_than (unix seconds)."""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute('DELETE FROM processed_updates WHERE updated_at < ?', (older_than,))
+    return cursor.rowcount
+
+def load_conversation(user_id):
+    """Return (summary, summarized_through_seq, [(seq, role, text), ...]) for a user."""
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT summary, through_seq FROM conversation_summaries WHERE user_id = ?', (user_id,))
+    summary, through_seq = cursor.fetchone() or (None, 0)
+    cursor.execute('SELECT seq, role, text FROM conversation_turns WHERE user_id = ? ORDER BY seq', (user_id,))
+    turns = [(seq, role, zlib.decompress(text).decode('utf-8')) for seq, role, text in cursor.fetchall()]
+    return summary, through_seq, turns
+
+def save_turns(user_id, turns):
+    """Store conversation turns given as (seq, role, text)."""
+    conn = get_connection()
+    with conn:
+        conn.executemany('INSERT OR REPLACE INTO conversation_turns (user_id, seq, role, text) VALUES (?, ?, ?, ?)',
+                         [(user_id, seq, role, zlib.compress(text.encode('utf-8'))) for seq, role, text in turns])
+
+def save_summary(user_id, summary, through_seq):
+    """Replace the user's summary and drop the turns it now covers."""
+    conn = get_connection()
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO conversation_summaries (user_id, summary, through_seq) VALUES (?, ?, ?)',
+                     (user_id, summary, through_seq))
+        conn.execute('DELETE FROM conversation_turns WHERE user_id = ? AND seq <= ?', (user_id, through_seq))
+
+# --- Async API (use these from handlers) ---
+
+async def init_db_async():
+    return await run(init_db)
+
+async def get_user_async(user_id):
+    return await run(get_user, user_id)
+
+async def add_user_async(user_id, username, first_name):
+    return await run(add_user, user_id, username, first_name)
+
+async def load_session_async(user_id):
+    return await run(load_session, user_id)
+
+async def get_subscription_async(user_id):
+    return await run(get_subscription, user_id)
+
+async def save_sessions_async(rows):
+    return await run(save_sessions, rows)
+
+async def set_subscription_async(user_id, level):
+    return await run(set_subscription, user_id, level)
+
+async def get_stats_async():
+    return await run(get_stats)
+
+async def get_preview_file_id_async(voice_id, preview_url):
+    return await run(get_preview_file_id, voice_id, preview_url)
+
+async def save_preview_file_id_async(voice_id, preview_url, file_id):
+    return await run(save_preview_file_id, voice_id, preview_url, file_id)
+
+async def invalidate_previews_async(preview_urls):
+    return await run(invalidate_previews, preview_urls)
+
+async def create_broadcast_async(text, admin_chat_id):
+    return await run(create_broadcast, text, admin_chat_id)
+
+async def get_running_broadcast_async():
+    return await run(get_running_broadcast)
+
+async def get_broadcast_recipients_async(after_user_id, limit):
+    return await run(get_broadcast_recipients, after_user_id, limit)
+
+async def checkpoint_broadcast_async(broadcast_id, last_user_id, sent, failed, unreachable_ids):
+    return await run(checkpoint_broadcast, broadcast_id, last_user_id, sent, failed, unreachable_ids)
+
+async def finish_broadcast_async(broadcast_id, status='done'):
+    return await run(finish_broadcast, broadcast_id, status)
+
+async def get_broadcast_status_async(broadcast_id):
+    return await run(get_broadcast_status, broadcast_id)
+
+async def claim_update_async(chat_id, message_id, stale_before):
+    return await run(claim_update, chat_id, message_id, stale_before)
+
+async def finish_update_async(chat_id, message_id):
+    return await run(finish_update, chat_id, message_id)
+
+async def release_updates_async(keys):
+    return await run(release_updates, keys)
+
+async def prune_updates_async(older_than):
+    return await run(prune_updates, older_than)
+
+async def load_conversation_async(user_id):
+    return await run(load_conversation, user_id)
+
+async def save_turns_async(user_id, turns):
+    return await run(save_turns, user_id, turns)
+
+async def save_summary_async(user_id, summary, through_seq):
+    return await run(save_summary, user_id, summary, through_seq)
@@ -0,0 +1,91 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class UpdateDeduplicator:
+    """Make sure each incoming message is answered at most once.
+
+    A message is claimed by (chat_id, message_id) before any paid work starts
+    and marked done when its reply has been handled. Telegram redelivers an
+    update when a webhook response or a getUpdates offset was lost (e.g. on
+    restart); such a duplicate finds the claim and is skipped, since the
+    user already has (or is about to get) the reply. Claims are stored in
+    SQLite so they survive restarts and are shared by webhook workers; an
+    LRU of recently seen keys answers most repeats without touching the DB.
+
+    A claim left in flight by a crashed process is taken over after
+    `stale_after` seconds. Rows older than `window` are pruned every
+    `prune_interval` seconds (Telegram keeps undelivered updates for 24h).
+    """
+
+    def __init__(self, max_size: int = 50_000, stale_after: float = 600.0,
+                 window: float = 2 * 86400, prune_interval: float = 3600.0):
+        self.max_size = max_size
+        self.stale_after = stale_after
+        self.window = window
+        self.prune_interval = prune_interval
+        self._seen = OrderedDict()
+        self._in_flight = set()
+        self._pruner = None
+
+    def start(self):
+        if self._pruner is None:
+            self._pruner = asyncio.create_task(self._prune_forever())
+
+    async def stop(self):
+        """Stop pruning and give back claims this process could not finish."""
+        if self._pruner is not None:
+            self._pruner.cancel()
+            try:
+                await self._pruner
+            except asyncio.CancelledError:
+                pass
+            self._pruner = None
+        if self._in_flight:
+            # Released, so the redelivered updates after a restart are handled
+            # right away instead of after stale_after.
+            await database.release_updates_async(list(self._in_flight))
+            self._in_flight.clear()
+
+    async def claim(self, chat_id: int, message_id: int) -> bool:
+        """Claim a message for processing. False if it was already seen."""
+        key = (chat_id, message_id)
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            metrics.inc("duplicate_updates_total", source="memory")
+            return False
+        claimed = await database.claim_update_async(chat_id, message_id, int(time.time() - self.stale_after))
+        self._remember(key)
+        if not claimed:
+            metrics.inc("duplicate_updates_total", source="db")
+            logger.info(f"Skipping duplicate message {message_id} in chat {chat_id}")
+            return False
+        self._in_flight.add(key)
+        return True
+
+    async def finish(self, chat_id: int, message_id: int):
+        """Mark a claimed message as answered."""
+        key = (chat_id, message_id)
+        self._in_flight.discard(key)
+        await database.finish_update_async(chat_id, message_id)
+
+    def _remember(self, key):
+        self._seen[key] = None
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+    async def _prune_forever(self):
+        while True:
+            await asyncio.sleep(self.prune_interval)
+            try:
+                removed = await database.prune_updates_async(int(time.time() - self.window))
+                if removed:
+                    logger.info(f"Pruned {removed} processed message ids.")
+            except Exception as e:
+                logger.error(f"Failed to prune processed message ids: {e}")
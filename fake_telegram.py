@@ -0,0 +1,174 @@
+"""Local stand-in for Telegram, for testing webhook mode without a real bot.
+
+It does two things:
+  * serves a fake Bot API (getMe, sendMessage, sendVoice, ...) that accepts
+    every call and records it, so workers can reply without reaching Telegram;
+  * posts synthetic updates to the bot's webhook, like Telegram would.
+
+Example:
+    TELEGRAM_API_URL=http://127.0.0.1:8081 SERVE_MODE=webhook WEBHOOK_WORKERS=4 \\
+        WEBHOOK_SECRET=test python bot.py
+    python fake_telegram.py --api-port 8081 --webhook http://127.0.0.1:8443/telegram \\
+        --secret test --users 20 --messages 5
+"""
+import re
+import json
+import time
+import argparse
+import itertools
+import threading
+import urllib.request
+from collections import Counter
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BOT_USER = {"id": 1000000, "is_bot": True, "first_name": "SoulVoice", "username": "soulvoice_test_bot"}
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # the default of 5 resets connections under load
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}", "language_code": "en"}
+
+def _chat(chat_id):
+    return {"id": chat_id, "type": "private", "first_name": f"User{chat_id}"}
+
+class FakeBotAPI:
+    """Fake Bot API server. Every call succeeds; calls are counted per method."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.bytes_received = 0
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.server = Server((host, port), self._handler())
+        self.port = self.server.server_address[1]
+        self.url = f"http://{host}:{self.port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _result(self, method, params):
+        chat_id = int(params.get("chat_id", 0) or 0)
+        message = {"message_id": next(self._message_ids), "date": int(time.time()), "chat": _chat(chat_id), "from": BOT_USER}
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            return dict(message, text=params.get("text", ""))
+        if method == "sendVoice":
+            return dict(message, voice={"file_id": f"voice{message['message_id']}", "file_unique_id": f"v{message['message_id']}", "duration": 1})
+        if method == "sendAudio":
+            return dict(message, audio={"file_id": f"audio{message['message_id']}", "file_unique_id": f"a{message['message_id']}", "duration": 1})
+        if method == "editMessageReplyMarkup":
+            return message
+        return True
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                method = self.path.rstrip("/").rsplit("/", 1)[-1]
+                params = _parse_params(self.headers.get("Content-Type", ""), body)
+                with api._lock:
+                    api.calls[method] += 1
+                    api.bytes_received += len(body)
+                if api.latency:
+                    time.sleep(api.latency)
+                payload = json.dumps({"ok": True, "result": api._result(method, params)}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def _parse_params(content_type, body):
+    if "json" in content_type:
+        return json.loads(body or b"{}")
+    if "multipart" in content_type:
+        return {
+            name.decode(): value.decode(errors="replace")
+            for name, value in re.findall(rb'name="([^"]+)"\r\n(?:[^\r\n]+\r\n)*\r\n([^\r]{0,256})\r\n', body)
+        }
+    return {key: values[0] for key, values in parse_qs(body.decode(errors="replace")).items()}
+
+class UpdateFactory:
+    """Builds Telegram update dicts with increasing update_ids."""
+
+    def __init__(self, start=1):
+        self._update_ids = itertools.count(start)
+        self._message_ids = itertools.count(start)
+
+    def message(self, user_id, text):
+        message = {"message_id": next(self._message_ids), "date": int(time.time()), "chat": _chat(user_id), "from": _user(user_id), "text": text}
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def callback(self, user_id, data):
+        message = {"message_id": next(self._message_ids), "date": int(time.time()), "chat": _chat(user_id), "from": BOT_USER, "text": "..."}
+        return {"update_id": next(self._update_ids), "callback_query": {"id": str(next(self._message_ids)), "from": _user(user_id), "chat_instance": str(user_id), "message": message, "data": data}}
+
+def post_update(webhook_url, update, secret=None):
+    request = urllib.request.Request(webhook_url, data=json.dumps(update).encode(), headers={"Content-Type": "application/json"})
+    if secret:
+        request.add_header("X-Telegram-Bot-Api-Secret-Token", secret)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api-port", type=int, default=8081, help="port for the fake Bot API (0 = don't serve it)")
+    parser.add_argument("--webhook", help="bot webhook URL to post updates to")
+    parser.add_argument("--secret", help="webhook secret token")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=3, help="text messages per user")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--wait", type=float, default=30, help="seconds to keep the fake API up after sending")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(port=args.api_port).start() if args.api_port else None
+    if api:
+        print(f"Fake Bot API on {api.url}")
+    if args.webhook:
+        factory = UpdateFactory()
+        updates = []
+        for user_id in range(1, args.users + 1):
+            updates.append(factory.message(user_id, "/start"))
+            updates.append(factory.callback(user_id, "lang_en"))
+        for i in range(args.messages):
+            for user_id in range(1, args.users + 1):
+                updates.append(factory.message(user_id, f"I feel a bit lonely today ({i})"))
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            statuses = Counter(pool.map(lambda u: post_update(args.webhook, u, args.secret), updates))
+        elapsed = time.monotonic() - started
+        print(f"Posted {len(updates)} updates in {elapsed:.2f}s ({len(updates) / elapsed:.0f}/s), statuses {dict(statuses)}")
+
+    if api:
+        time.sleep(args.wait)
+        print(f"Bot API calls: {dict(api.calls)}")
+        api.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Local stand-ins for OpenRouter and ElevenLabs, for benchmarks and tests.
+
+Both servers accept any API key and can be given a latency and error profile,
+so the bot can be driven at full speed without spending API credits.
+"""
+import re
+import json
+import time
+import random
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+
+from fake_telegram import Server
+
+REPLY_TEXT = (
+    "I hear you, and I want you to know that what you feel matters. It is okay to be tired, "
+    "and it is okay to not have everything figured out today. Take a slow breath with me. "
+    "You have carried so much, and you are still here, still trying, and that is brave. "
+    "Be gentle with yourself tonight. Make a warm cup of tea, wrap yourself in something soft, "
+    "and let the world wait for a little while. Tomorrow can be a new beginning, and you do not "
+    "have to face it alone. I am proud of you, and I believe in you, more than you know. "
+    "Whenever the thoughts get loud, come back and talk to me. I will always listen."
+)
+
+class Profile:
+    """Latency (seconds, mean +- jitter) and the share of requests that fail."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 500):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def delay(self, extra: float = 0.0):
+        seconds = self.latency + extra + random.uniform(-self.jitter, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+class _FakeServer:
+    def __init__(self, profile: Profile, host: str = "127.0.0.1", port: int = 0):
+        self.profile = profile
+        self.calls = Counter()
+        self.errors = 0
+        self._lock = threading.Lock()
+        self.server = Server((host, port), self._handler())
+        self.port = self.server.server_address[1]
+        self.url = f"http://{host}:{self.port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, name, failed=False):
+        with self._lock:
+            self.calls[name] += 1
+            self.errors += failed
+
+    def handle(self, request, method, body):
+        raise NotImplementedError
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _dispatch(self, method):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+                fake.handle(self, method, body)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def _send(request, status, body: bytes, content_type="application/json", headers=None):
+    request.send_response(status)
+    request.send_header("Content-Type", content_type)
+    request.send_header("Content-Length", str(len(body)))
+    for key, value in (headers or {}).items():
+        request.send_header(key, value)
+    request.end_headers()
+    request.wfile.write(body)
+
+class FakeOpenRouter(_FakeServer):
+    """OpenAI-compatible /chat/completions, plain and stream=True (SSE)."""
+
+    def __init__(self, profile: Profile, reply: str = REPLY_TEXT, tokens_per_second: float = 200, **kwargs):
+        super().__init__(profile, **kwargs)
+        self.reply = reply
+        self.tokens_per_second = tokens_per_second
+
+    def handle(self, request, method, body):
+        if not request.path.endswith("/chat/completions"):
+            _send(request, 404, b"{}")
+            return
+        params = json.loads(body or b"{}")
+        model = params.get("model", "fake")
+        failed = self.profile.fails()
+        self.count(model, failed)
+        self.profile.delay()
+        if failed:
+            _send(request, self.profile.error_status, json.dumps({"error": {"message": "fake upstream error"}}).encode())
+            return
+        created = int(time.time())
+        if not params.get("stream"):
+            payload = {
+                "id": "fake", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": self.reply}}],
+            }
+            _send(request, 200, json.dumps(payload).encode())
+            return
+
+        request.send_response(200)
+        request.send_header("Content-Type", "text/event-stream")
+        request.send_header("Connection", "close")
+        request.end_headers()
+        request.close_connection = True
+        words = re.findall(r"\S+\s*", self.reply)
+        for word in words:
+            chunk = {
+                "id": "fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+            }
+            request.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            request.wfile.flush()
+            time.sleep(1 / self.tokens_per_second)
+        request.wfile.write(b"data: [DONE]\n\n")
+        request.wfile.flush()
+
+class FakeElevenLabs(_FakeServer):
+    """GET /v1/voices and POST /v1/text-to-speech/<voice_id>.
+
+    Synthesis takes profile latency plus `seconds_per_char` per character and
+    returns `bytes_per_char` bytes of fake audio per character.
+    """
+
+    def __init__(self, profile: Profile, voices: int = 12, seconds_per_char: float = 0.0005,
+                 bytes_per_char: int = 40, **kwargs):
+        super().__init__(profile, **kwargs)
+        self.voices = [
+            {
+                "voice_id": f"voice{i:02d}",
+                "name": f"Voice {i}",
+                "category": "premade",
+                "preview_url": f"https://example.invalid/preview/voice{i:02d}.mp3",
+            }
+            for i in range(voices)
+        ]
+        self.seconds_per_char = seconds_per_char
+        self.bytes_per_char = bytes_per_char
+        self.characters = 0
+
+    def handle(self, request, method, body):
+        path = request.path.split("?")[0]
+        if method == "GET" and path.rstrip("/").endswith("/v1/voices"):
+            self.count("voices")
+            _send(request, 200, json.dumps({"voices": self.voices}).encode())
+            return
+        match = re.search(r"/v1/text-to-speech/([^/]+)$", path)
+        if method != "POST" or not match:
+            _send(request, 404, b"{}")
+            return
+        text = json.loads(body or b"{}").get("text", "")
+        failed = self.profile.fails()
+        self.count("tts", failed)
+        if failed:
+            self.profile.delay()
+            _send(request, self.profile.error_status, b'{"detail": "fake upstream error"}', headers={"Retry-After": "0"})
+            return
+        with self._lock:
+            self.characters += len(text)
+        self.profile.delay(self.seconds_per_char * len(text))
+        _send(request, 200, b"\xff\xfb" * (self.bytes_per_char * len(text) // 2), content_type="audio/mpeg")
@@ -0,0 +1,175 @@
+import time
+import asyncio
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """Skips a model after `threshold` consecutive failures, for `cooldown` seconds.
+
+    After the cooldown one request is let through (half-open); success closes
+    the breaker, another failure opens it again.
+    """
+    __slots__ = ("threshold", "cooldown", "failures", "opened_at")
+
+    def __init__(self, threshold: int = 3, cooldown: float = 60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self, now: float) -> bool:
+        if self.opened_at is None:
+            return True
+        if now - self.opened_at >= self.cooldown:
+            self.opened_at = now  # half-open: one probe per cooldown
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self, now: float):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit opened after {self.failures} failures")
+            self.opened_at = now
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+class LLMRouter:
+    """Chat completions over a chain of models with deadlines and hedging.
+
+    The first healthy model in the chain is asked first. If it has not
+    answered after `hedge_after` seconds the next one is asked too, and the
+    first good answer wins (the other request is cancelled). A failed request
+    immediately falls through to the next model. Every call is bounded by
+    `deadline`, and models whose breaker is open are skipped.
+    """
+
+    def __init__(self, client, models, deadline: float = 30.0, hedge_after: float = 6.0,
+                 extra_body=None, breaker_threshold: int = 3, breaker_cooldown: float = 60.0):
+        self.client = client
+        self.models = list(models)
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.extra_body = extra_body
+        self.breakers = {m: CircuitBreaker(breaker_threshold, breaker_cooldown) for m in self.models}
+        self.calls = {m: {"ok": 0, "error": 0, "cancelled": 0} for m in self.models}
+
+    def stats(self):
+        """{model: {"ok", "error", "cancelled", "circuit_open"}}"""
+        return {m: dict(self.calls[m], circuit_open=self.breakers[m].is_open) for m in self.models}
+
+    def _candidates(self):
+        now = time.monotonic()
+        healthy = [m for m in self.models if self.breakers[m].allow(now)]
+        # Everything tripped: try the chain anyway rather than fail outright
+        return healthy or list(self.models)
+
+    async def _attempt(self, model, call):
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(call(model), self.deadline)
+        except asyncio.CancelledError:
+            self.calls[model]["cancelled"] += 1
+            raise
+        except Exception as e:
+            self.calls[model]["error"] += 1
+            self.breakers[model].failure(time.monotonic())
+            metrics.inc("upstream_errors_total", upstream="openrouter")
+            metrics.inc("llm_calls_total", model=model, outcome="error")
+            logger.warning(f"LLM {model} failed after {time.perf_counter() - started:.1f}s: {e!r}")
+            raise
+        self.calls[model]["ok"] += 1
+        self.breakers[model].success()
+        metrics.inc("llm_calls_total", model=model, outcome="ok")
+        metrics.observe("llm_model_seconds", time.perf_counter() - started, model=model)
+        return result
+
+    async def _race(self, call):
+        """Run call(model) over the chain with hedging; return the first success."""
+        candidates = self._candidates()
+        pending = {}
+        last_error = None
+        hedged = False
+
+        def launch():
+            model = candidates.pop(0)
+            pending[asyncio.create_task(self._attempt(model, call))] = model
+
+        launch()
+        try:
+            while pending:
+                # Hedge once: only while a single request is out and nobody answered yet
+                timeout = self.hedge_after if (candidates and not hedged and len(pending) == 1) else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    metrics.inc("llm_hedges_total")
+                    logger.info(f"LLM {next(iter(pending.values()))} slow, hedging with {candidates[0]}")
+                    launch()
+                    continue
+                for task in done:
+                    model = pending.pop(task)
+                    if task.exception() is None:
+                        if hedged:
+                            metrics.inc("llm_hedge_wins_total", model=model)
+                        return task.result()
+                    last_error = task.exception()
+                # Failed requests fall through to the next model right away
+                if candidates and len(pending) < (2 if hedged else 1):
+                    launch()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def complete(self, messages) -> str:
+        """Whole completion text from the fastest healthy model."""
+        async def call(model):
+            response = await self.client.chat.completions.create(
+                model=model, messages=messages, extra_body=self.extra_body, timeout=self.deadline
+            )
+            text = response.choices[0].message.content if response.choices else None
+            if not text:
+                raise ValueError("empty completion")
+            return text
+
+        return await self._race(call)
+
+    async def stream(self, messages):
+        """Yield the completion as it is generated.
+
+        Hedging and fallback apply until the first text arrives; after that we
+        are committed to that model and a failure ends the stream.
+        """
+        async def open_stream(model):
+            stream = await self.client.chat.completions.create(
+                model=model, messages=messages, extra_body=self.extra_body, stream=True, timeout=self.deadline
+            )
+            chunks = stream.__aiter__()
+            try:
+                async for chunk in chunks:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        return stream, chunks, chunk.choices[0].delta.content
+            except BaseException:
+                await stream.close()
+                raise
+            await stream.close()
+            raise ValueError("empty completion")
+
+        stream, chunks, first = await self._race(open_stream)
+        try:
+            yield first
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
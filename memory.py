@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+USER, ASSISTANT = 0, 1
+ROLES = {USER: "user", ASSISTANT: "assistant"}
+
+# Summaries longer than this (characters) are cut, whatever the LLM returns.
+MAX_SUMMARY_CHARS = 800
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without a tokenizer (~3 chars/token covers Cyrillic too)."""
+    return len(text) // 3 + 1
+
+class Conversation:
+    """Recent turns of one user, plus a summary of everything before them."""
+    __slots__ = ("user_id", "turns", "overflow", "summary", "next_seq", "summarizing")
+
+    def __init__(self, user_id: int, max_turns: int):
+        self.user_id = user_id
+        self.turns = deque(maxlen=max_turns)  # (seq, role, text), oldest first
+        self.overflow = []  # turns pushed out of the ring, not summarized yet
+        self.summary = None
+        self.next_seq = 1
+        self.summarizing = False
+
+    def append(self, role: int, text: str):
+        turn = (self.next_seq, role, text)
+        self.next_seq += 1
+        if len(self.turns) == self.turns.maxlen:
+            self.overflow.append(self.turns[0])
+        self.turns.append(turn)
+        return turn
+
+    def messages(self, token_budget: int):
+        """Chat messages for the newest turns that fit in token_budget, oldest first."""
+        picked = []
+        used = 0
+        for _, role, text in reversed(self.turns):
+            used += estimate_tokens(text)
+            if used > token_budget:
+                break
+            picked.append({"role": ROLES[role], "content": text})
+        picked.reverse()
+        # Chat models expect history to start with the user's turn.
+        if picked and picked[0]["role"] != "user":
+            picked.pop(0)
+        return picked
+
+class ConversationMemory:
+    """Per-user conversation history with flat prompt size.
+
+    Every turn is stored in SQLite (zlib-compressed) right away. In memory,
+    each user keeps only the last `max_turns` turns in a ring buffer, and
+    prompts use as many of them as fit in `token_budget`. Turns pushed out of
+    the ring are folded into a short running summary by `summarize` (an async
+    callable (summary, turns) -> text) on a background task once
+    `summarize_every` of them have piled up; the folded turns are then
+    deleted from SQLite. Conversations are kept for the `max_users` most
+    recently active users and loaded back from SQLite on demand.
+    """
+
+    def __init__(self, summarize, max_turns: int = 6, token_budget: int = 1200,
+                 summarize_every: int = 4, max_users: int = 10_000):
+        self.summarize = summarize
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summarize_every = summarize_every
+        self.max_users = max_users
+        self._conversations = OrderedDict()
+        self._tasks = set()
+
+    async def get(self, user_id: int) -> Conversation:
+        conversation = self._conversations.get(user_id)
+        if conversation is not None:
+            self._conversations.move_to_end(user_id)
+            return conversation
+
+        summary, summarized_through, turns = await database.load_conversation_async(user_id)
+        conversation = self._conversations.get(user_id)  # loaded meanwhile
+        if conversation is None:
+            conversation = Conversation(user_id, self.max_turns)
+            conversation.summary = summary
+            conversation.next_seq = summarized_through + 1
+            for seq, role, text in turns:
+                conversation.next_seq = seq
+                conversation.append(role, text)
+            self._conversations[user_id] = conversation
+            while len(self._conversations) > self.max_users:
+                self._conversations.popitem(last=False)
+            self._maybe_summarize(conversation)
+        return conversation
+
+    def prompt(self, conversation: Conversation, system_prompt: str, user_prompt: str):
+        """Build the LLM messages: system (+ summary), recent history, new prompt."""
+        if conversation.summary:
+            system_prompt = f"{system_prompt}\n\nWhat you know from earlier conversations: {conversation.summary}"
+        return [
+            {"role": "system", "content": system_prompt},
+            *conversation.messages(self.token_budget),
+            {"role": "user", "content": user_prompt},
+        ]
+
+    async def add_exchange(self, conversation: Conversation, user_text: str, reply_text: str):
+        """Remember one user message and the bot's reply."""
+        turns = [conversation.append(USER, user_text), conversation.append(ASSISTANT, reply_text)]
+        await database.save_turns_async(conversation.user_id, turns)
+        self._maybe_summarize(conversation)
+
+    async def stop(self):
+        """Wait for running summaries so they are not lost on shutdown."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _maybe_summarize(self, conversation: Conversation):
+        if conversation.summarizing or len(conversation.overflow) < self.summarize_every:
+            return
+        conversation.summarizing = True
+        task = asyncio.create_task(self._summarize(conversation))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, conversation: Conversation):
+        folded = list(conversation.overflow)
+        try:
+            summary = await self.summarize(conversation.summary, [(role, text) for _, role, text in folded])
+            summary = summary.strip()[:MAX_SUMMARY_CHARS]
+            await database.save_summary_async(conversation.user_id, summary, folded[-1][0])
+            conversation.summary = summary
+            del conversation.overflow[:len(folded)]
+            metrics.inc("conversation_summaries_total", outcome="ok")
+        except Exception as e:
+            # The turns stay in overflow and are retried after the next exchange.
+            metrics.inc("conversation_summaries_total", outcome="error")
+            logger.warning(f"Failed to summarize conversation of {conversation.user_id}: {e}")
+        finally:
+            conversation.summarizing = False
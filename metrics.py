@@ -0,0 +1,151 @@
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "soulvoice"
+
+# Bucket upper bounds in seconds: 5 ms .. ~2.5 min, growing by 1.25x.
+BUCKETS = tuple(round(0.005 * 1.25 ** i, 4) for i in range(47))
+
+class Histogram:
+    """Fixed-bucket histogram: O(log buckets) observe, approximate quantiles."""
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+_histograms = {}  # (name, labels) -> Histogram
+_counters = {}    # (name, labels) -> float
+_gauges = {}      # name -> callable returning {labels: value} or a number
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def observe(name: str, seconds: float, **labels):
+    key = _key(name, labels)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = Histogram()
+    histogram.observe(seconds)
+
+def inc(name: str, amount: float = 1, **labels):
+    key = _key(name, labels)
+    _counters[key] = _counters.get(key, 0) + amount
+
+def gauge(name: str, func):
+    """Register a gauge read at scrape time. func() -> number or {labels_tuple: number}."""
+    _gauges[name] = func
+
+@contextmanager
+def timer(stage: str):
+    """Time a block into the stage_seconds histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("stage_seconds", time.perf_counter() - started, stage=stage)
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for (name, labels), histogram in sorted(list(_histograms.items())):
+        full = f"{PREFIX}_{name}"
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ("+Inf",), histogram.counts):
+            cumulative += n
+            lines.append(f"{full}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{full}_sum{_labels(labels)} {histogram.sum}")
+        lines.append(f"{full}_count{_labels(labels)} {histogram.count}")
+        for q in (0.5, 0.95, 0.99):
+            lines.append(f"{full}_quantile{_labels(labels, [('quantile', q)])} {histogram.quantile(q)}")
+    for (name, labels), value in sorted(list(_counters.items())):
+        lines.append(f"{PREFIX}_{name}{_labels(labels)} {value}")
+    for name, func in sorted(list(_gauges.items())):
+        try:
+            value = func()
+        except Exception as e:
+            logger.warning(f"Gauge {name} failed: {e}")
+            continue
+        if isinstance(value, dict):
+            for labels, v in value.items():
+                lines.append(f"{PREFIX}_{name}{_labels(labels)} {v}")
+        else:
+            lines.append(f"{PREFIX}_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+def summary() -> str:
+    """Short human-readable digest of stage latencies and upstream errors."""
+    lines = []
+    for (name, labels), h in sorted(list(_histograms.items())):
+        if name != "stage_seconds" or not h.count:
+            continue
+        stage = dict(labels).get("stage")
+        lines.append(
+            f"{stage}: p50 {h.quantile(0.5):.2f}s, p95 {h.quantile(0.95):.2f}s, "
+            f"p99 {h.quantile(0.99):.2f}s (n={h.count})"
+        )
+    for (name, labels), h in sorted(list(_histograms.items())):
+        if name == "llm_model_seconds" and h.count:
+            model = dict(labels).get("model")
+            failed = _counters.get(("llm_calls_total", (("model", model), ("outcome", "error"))), 0)
+            lines.append(f"{model}: p50 {h.quantile(0.5):.2f}s, p95 {h.quantile(0.95):.2f}s, ok {h.count}, failed {int(failed)}")
+    for (name, labels), value in sorted(list(_counters.items())):
+        if name in ("upstream_errors_total", "upstream_retries_total"):
+            upstream = dict(labels).get("upstream")
+            lines.append(f"{upstream} {name.split('_')[1]}: {int(value)}")
+    return "\n".join(lines)
+
+def start_http_server(port: int, host: str = "0.0.0.0"):
+    """Serve /metrics on a background thread."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Metrics available on http://{host}:{port}/metrics")
+    return server
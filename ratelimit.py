@@ -0,0 +1,53 @@
+import time
+from collections import OrderedDict
+
+class TokenBucket:
+    """Classic token bucket: `capacity` tokens, refilled at `rate` tokens/second."""
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float, amount: float = 1) -> float:
+        """Take tokens if available. Returns 0, or the seconds to wait until they are."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+class RateLimiter:
+    """Per-key token buckets kept in memory.
+
+    Each key may burst up to `burst` requests and then gets one more every
+    `period` seconds. Buckets are kept in LRU order and the least recently
+    used are dropped beyond `max_keys`; a dropped bucket would have refilled
+    anyway unless it was hit very recently.
+    """
+
+    def __init__(self, period: float, burst: int = 1, max_keys: int = 100_000, clock=time.monotonic):
+        self.period = period
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+
+    def check(self, key) -> float:
+        """Consume one token for key. Returns 0 if allowed, else seconds to wait."""
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.burst, 1 / self.period, now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(now)
+
+    def __len__(self):
+        return len(self._buckets)
@@ -0,0 +1,116 @@
+import time
+import asyncio
+import logging
+import itertools
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Lanes are served strictly in this order: a free job only starts when no
+# premium job is waiting.
+LANE_PREMIUM = 0
+LANE_FREE = 1
+
+class QueueFull(Exception):
+    """Raised by submit() when the lane is at its max depth (load shedding)."""
+
+class Job:
+    __slots__ = ("func", "future", "enqueued", "position")
+
+    def __init__(self, func, future, position):
+        self.func = func
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.position = position
+
+    def __await__(self):
+        return self.future.__await__()
+
+class JobScheduler:
+    """Bounded worker pool fed by a priority queue with one lane per tier.
+
+    submit() returns a Job that can be awaited for the result. Each lane has
+    its own max queue depth; beyond it new jobs are rejected with QueueFull
+    instead of piling up. Queue depth and wait time are kept for sizing the
+    worker count.
+    """
+
+    def __init__(self, workers: int, max_depth: dict):
+        self.workers = workers
+        self.max_depth = dict(max_depth)
+        self.depth = {lane: 0 for lane in self.max_depth}
+        self.busy = 0
+        self.processed = 0
+        self.shed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._queue = None
+        self._tasks = []
+        self._seq = itertools.count()
+
+    def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Scheduler started with {self.workers} workers, max depth {self.max_depth}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, lane: int, func) -> Job:
+        """Queue func (an async callable without arguments) on a lane."""
+        if self.depth[lane] >= self.max_depth[lane]:
+            self.shed += 1
+            raise QueueFull(f"lane {lane} is full ({self.depth[lane]} waiting)")
+        idle = self.workers - self.busy - sum(self.depth.values())
+        # Jobs ahead of this one: everything in higher-priority lanes and
+        # everything already in the same lane. 0 means it starts right away.
+        ahead = sum(depth for l, depth in self.depth.items() if l <= lane)
+        position = 0 if idle > 0 else ahead + 1
+        job = Job(func, asyncio.get_running_loop().create_future(), position)
+        self.depth[lane] += 1
+        self._queue.put_nowait((lane, next(self._seq), job))
+        return job
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "depth": dict(self.depth),
+            "processed": self.processed,
+            "shed": self.shed,
+            "avg_wait": self.total_wait / self.processed if self.processed else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            lane, _, job = await self._queue.get()
+            self.depth[lane] -= 1
+            if job.future.cancelled():
+                continue  # the caller gave up while waiting
+            wait = time.monotonic() - job.enqueued
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            metrics.observe("queue_wait_seconds", wait, lane=lane)
+            self.busy += 1
+            try:
+                result = await job.func()
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.busy -= 1
+                self.processed += 1
+                if self.processed % 100 == 0:
+                    logger.info(f"Scheduler stats: {self.stats()}")
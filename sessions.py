@@ -0,0 +1,161 @@
+import time
+import asyncio
+import datetime
+import logging
+from collections import OrderedDict
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class Session:
+    """Hot per-user state: what every message and button tap needs."""
+    __slots__ = ("user_id", "lang", "voice_id", "tier", "messages_today", "day", "checked_at")
+
+    def __init__(self, user_id, lang, voice_id, tier, messages_today, day, checked_at):
+        self.user_id = user_id
+        self.lang = lang or "en"
+        self.voice_id = voice_id
+        self.tier = tier or 0
+        self.messages_today = messages_today or 0
+        self.day = day
+        self.checked_at = checked_at
+
+    def __repr__(self):
+        return f"Session({self.user_id}, lang={self.lang!r}, voice_id={self.voice_id!r}, tier={self.tier})"
+
+class SessionStore:
+    """Bounded LRU cache of Sessions in front of the users table.
+
+    Reads hit SQLite only on a cache miss. Changes are written behind: they
+    mark the session dirty and a background task saves dirty sessions every
+    `flush_interval` seconds in one transaction per `batch_size` users, plus
+    once more on stop(). A dirty session stays reachable after LRU eviction
+    until it is saved, so a quick return never reads stale rows.
+
+    The tier is re-read from the DB (one small query) when a cached session
+    is older than `tier_ttl`, or after invalidate(): subscriptions change
+    outside this process (/add_premium may run in another webhook worker).
+    The cached language, voice and daily quota assume a single writer per
+    user: webhook.shard_key routes every update by its sender (from.id), not
+    by chat, so a user writing both in private and in a group is still
+    served by one process. Sharding by chat would let two processes each
+    grant the free limit and overwrite each other's count.
+    """
+
+    def __init__(self, max_size: int = 100_000, tier_ttl: float = 300.0, flush_interval: float = 1.0,
+                 batch_size: int = 500, clock=time.monotonic):
+        self.max_size = max_size
+        self.tier_ttl = tier_ttl
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.clock = clock
+        self._cache = OrderedDict()
+        self._dirty = {}
+        self._loading = {}
+        self._flusher = None
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {"size": len(self._cache), "dirty": len(self._dirty), "hits": self.hits, "misses": self.misses}
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_forever())
+
+    async def stop(self):
+        """Stop the background flusher and save everything still pending."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def get(self, user_id: int):
+        """Return the user's Session, or None if the user is unknown."""
+        session = self._cache.get(user_id)
+        if session is not None:
+            self._cache.move_to_end(user_id)
+            self.hits += 1
+            if self.clock() - session.checked_at > self.tier_ttl:
+                session.tier = await database.get_subscription_async(user_id) or 0
+                session.checked_at = self.clock()
+            return session
+
+        self.misses += 1
+        session = self._dirty.get(user_id)
+        if session is None:
+            # Concurrent misses for the same user share one query.
+            loading = self._loading.get(user_id)
+            if loading is None:
+                loading = asyncio.ensure_future(database.load_session_async(user_id))
+                self._loading[user_id] = loading
+                loading.add_done_callback(lambda _: self._loading.pop(user_id, None))
+            row = await asyncio.shield(loading)
+            if row is None:
+                return None
+            session = self._cache.get(user_id) or Session(user_id, *row, checked_at=self.clock())
+        self._remember(session)
+        return session
+
+    def invalidate(self, user_id: int):
+        """Make the next get() re-read the user's tier from the DB."""
+        session = self._cache.get(user_id) or self._dirty.get(user_id)
+        if session is not None:
+            session.checked_at = float("-inf")
+
+    def update(self, session: Session, **fields):
+        """Change session fields; they are saved to the DB on the next flush."""
+        for name, value in fields.items():
+            setattr(session, name, value)
+        self._dirty[session.user_id] = session
+
+    def reserve(self, session: Session, limit: int = 3) -> bool:
+        """Count one generation against today's quota. False if the limit is hit."""
+        today = str(datetime.date.today())
+        count = session.messages_today if session.day == today else 0
+        if session.tier < 1 and count >= limit:
+            return False
+        self.update(session, messages_today=count + 1, day=today)
+        return True
+
+    def refund(self, session: Session):
+        """Give back a generation taken by reserve() when it failed."""
+        if session.day == str(datetime.date.today()) and session.messages_today > 0:
+            self.update(session, messages_today=session.messages_today - 1)
+
+    def _remember(self, session):
+        self._cache[session.user_id] = session
+        self._cache.move_to_end(session.user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    async def flush(self):
+        """Save dirty sessions to SQLite in batched transactions."""
+        while self._dirty:
+            batch = []
+            for user_id in list(self._dirty)[:self.batch_size]:
+                batch.append(self._dirty.pop(user_id))
+            rows = [(s.lang, s.voice_id, s.messages_today, s.day, s.user_id) for s in batch]
+            try:
+                await database.save_sessions_async(rows)
+            except Exception:
+                # Keep them for the next attempt (unless changed again since).
+                for session in batch:
+                    self._dirty.setdefault(session.user_id, session)
+                raise
+            metrics.inc("session_flushes_total")
+            metrics.inc("session_rows_flushed_total", len(rows))
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to save {len(self._dirty)} sessions: {e}")
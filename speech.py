@@ -0,0 +1,152 @@
+import re
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A sentence ends at . ! ? or … (optionally followed by closing quotes/brackets)
+# and whitespace. Newlines (paragraph breaks) also count as a boundary.
+SENTENCE_END = re.compile(r'(?<=[.!?…])["»”)\]]*\s+|\n\s*\n')
+
+# Very short sentences are glued to the next one: one TTS call per "Oh." is
+# wasteful and sounds choppy.
+MIN_SENTENCE_CHARS = 40
+
+# Segments for parallel synthesis: whole sentences, packed up to about this
+# many characters, so a 150-200 word reply becomes 3-5 TTS calls.
+SEGMENT_CHARS = 250
+
+def split_sentences(text: str, min_chars: int = MIN_SENTENCE_CHARS):
+    """Split text into sentence chunks of at least min_chars (except the last)."""
+    chunks = []
+    buffer = ""
+    for part in SENTENCE_END.split(text):
+        if not part or not part.strip():
+            continue
+        buffer = f"{buffer} {part.strip()}" if buffer else part.strip()
+        if len(buffer) >= min_chars:
+            chunks.append(buffer)
+            buffer = ""
+    if buffer:
+        chunks.append(buffer)
+    return chunks
+
+def split_segments(text: str, target_chars: int = SEGMENT_CHARS):
+    """Pack whole sentences into segments of up to about target_chars."""
+    segments = []
+    for sentence in split_sentences(text):
+        if segments and len(segments[-1]) + len(sentence) < target_chars:
+            segments[-1] = f"{segments[-1]} {sentence}"
+        else:
+            segments.append(sentence)
+    return segments
+
+async def synthesize_segments(segments, synthesize, fan_out: int = 3, timings=None):
+    """Synthesize segments concurrently and return their audio in order.
+
+    `synthesize` is an async callable (text, previous_text, next_text,
+    timing) -> audio bytes; the neighbouring segments are passed so the TTS
+    engine keeps intonation continuous across the joins, and `timing` is a
+    dict the callable fills with the seconds of its upstream work under
+    "upstream" (time spent queueing for a TTS slot must not count). At most
+    `fan_out` calls run at once. If a `timings` dict is passed, "tts_saved"
+    is set to the estimated seconds saved against one-by-one synthesis (the
+    sum of the upstream durations minus the wall time).
+    """
+    semaphore = asyncio.Semaphore(fan_out)
+    segment_timings = [{} for _ in segments]
+
+    async def synthesize_one(i):
+        previous_text = segments[i - 1] if i > 0 else None
+        next_text = segments[i + 1] if i + 1 < len(segments) else None
+        async with semaphore:
+            return await synthesize(segments[i], previous_text, next_text, segment_timings[i])
+
+    started = time.monotonic()
+    tasks = [asyncio.create_task(synthesize_one(i)) for i in range(len(segments))]
+    try:
+        parts = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    if timings is not None:
+        upstream = sum(timing.get("upstream", 0.0) for timing in segment_timings)
+        timings["tts_saved"] = max(0.0, upstream - (time.monotonic() - started))
+    return parts
+
+async def iter_sentences(deltas, min_chars: int = MIN_SENTENCE_CHARS):
+    """Turn an async stream of text deltas into an async stream of sentences."""
+    buffer = ""
+    async for delta in deltas:
+        buffer += delta
+        while True:
+            cut = None
+            for match in SENTENCE_END.finditer(buffer):
+                if match.start() >= min_chars:
+                    cut = match
+                    break
+            if cut is None:
+                break
+            sentence = buffer[:cut.start()].strip()
+            buffer = buffer[cut.end():]
+            if sentence:
+                yield sentence
+    if buffer.strip():
+        yield buffer.strip()
+
+async def stream_to_speech(deltas, synthesize, on_audio=None, timings=None):
+    """Synthesize sentences while the text is still being generated.
+
+    `deltas` is an async iterator of text pieces (e.g. an LLM stream),
+    `synthesize` is an async callable text -> audio bytes. Each sentence is
+    sent to TTS as soon as it is complete, so synthesis overlaps generation.
+
+    If `on_audio` is given it is awaited with each audio part, strictly in
+    order, as soon as that part is ready (progressive delivery).
+
+    Returns (full_text, audio_parts). Stage timings in seconds, relative to
+    the call, are written into `timings` if a dict is passed.
+    """
+    timings = timings if timings is not None else {}
+    started = time.monotonic()
+    sentences = []
+    pending = asyncio.Queue()
+
+    async def deliver():
+        parts = []
+        while True:
+            task = await pending.get()
+            if task is None:
+                return parts
+            audio = await task
+            if not parts:
+                timings["first_audio"] = time.monotonic() - started
+            parts.append(audio)
+            if on_audio is not None:
+                await on_audio(audio)
+
+    consumer = asyncio.create_task(deliver())
+    tasks = []
+    try:
+        async for sentence in iter_sentences(deltas):
+            if not sentences:
+                timings["first_sentence"] = time.monotonic() - started
+            sentences.append(sentence)
+            task = asyncio.create_task(synthesize(sentence))
+            tasks.append(task)
+            pending.put_nowait(task)
+            if consumer.done():
+                break  # delivery failed, stop feeding it
+        timings["llm"] = time.monotonic() - started
+        pending.put_nowait(None)
+        parts = await consumer
+    except BaseException:
+        consumer.cancel()
+        for task in tasks:
+            task.cancel()
+        raise
+    timings["tts_done"] = time.monotonic() - started
+    logger.debug(f"Streamed {len(sentences)} sentences to TTS")
+    return " ".join(sentences), parts
@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# bot.py reads its configuration at import time; nothing here talks to the network.
+_scratch = tempfile.mkdtemp(prefix="soulvoice-tests-")
+for name, value in {
+    "TELEGRAM_TOKEN": "1:test",
+    "OPENROUTER_API_KEY": "test",
+    "ELEVENLABS_API_KEY": "test",
+    "ADMIN_ID": "1",
+    "DATABASE_PATH": os.path.join(_scratch, "bot.db"),
+    "UPSELL_CACHE_DIR": os.path.join(_scratch, "upsell"),
+    "VOICE_SNAPSHOT_PATH": os.path.join(_scratch, "voices.json"),
+}.items():
+    os.environ.setdefault(name, value)
+
+import database
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh SQLite database for one test."""
+    database.close()
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "test.db"))
+    database.init_db()
+    yield database
+    database.close()
+
+class Clock:
+    """Manually advanced replacement for time.monotonic."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return Clock()
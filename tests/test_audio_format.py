@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+from elevenlabs.core.api_error import ApiError
+
+import audio
+import bot
+
+@pytest.fixture
+def no_ffmpeg(monkeypatch):
+    monkeypatch.setattr(audio, "has_ffmpeg", lambda: False)
+    monkeypatch.setattr(bot, "AUDIO_PROFILES", {0: "opus_48000_32", 1: "opus_48000_64"})
+    monkeypatch.setattr(bot, "AUDIO_TRANSCODE", False)
+    monkeypatch.setattr(bot, "STREAMING_TTS", False)
+    monkeypatch.setattr(bot, "SEGMENTED_TTS", False)
+    monkeypatch.setattr(bot, "_native_format_unsupported", set())
+
+def test_single_clip_keeps_opus_without_ffmpeg(no_ffmpeg):
+    assert bot.resolve_audio_format(1) == "opus_48000_64"
+
+def test_joined_reply_falls_back_to_mp3_without_ffmpeg(no_ffmpeg, monkeypatch):
+    assert bot.resolve_audio_format(0) == audio.FALLBACK_FORMAT  # upsell tail
+    monkeypatch.setattr(bot, "SEGMENTED_TTS", True)
+    assert bot.resolve_audio_format(1) == audio.FALLBACK_FORMAT
+
+def test_progressive_streaming_is_not_joined(no_ffmpeg, monkeypatch):
+    monkeypatch.setattr(bot, "STREAMING_TTS", True)
+    monkeypatch.setattr(bot, "STREAMING_DELIVERY", "progressive")
+    assert bot.resolve_audio_format(0) == "opus_48000_32"
+    monkeypatch.setattr(bot, "STREAMING_DELIVERY", "single")
+    assert bot.resolve_audio_format(1) == audio.FALLBACK_FORMAT
+
+def test_rejected_format_without_ffmpeg_returns_mp3(no_ffmpeg, monkeypatch):
+    requested = []
+
+    async def convert(text, voice_id, timing=None, **kwargs):
+        requested.append(kwargs["output_format"])
+        if kwargs["output_format"] != audio.FALLBACK_FORMAT:
+            raise ApiError(status_code=403, body={"detail": "output_format not allowed on your plan"})
+        return b"mp3"
+
+    monkeypatch.setattr(bot.tts_client, "convert", convert)
+    assert asyncio.run(bot.synthesize("hi", "voice", "mp3_44100_192")) == b"mp3"
+    assert requested == ["mp3_44100_192", audio.FALLBACK_FORMAT]
+    assert "mp3_44100_192" in bot._native_format_unsupported
@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+import database
+from broadcast import Broadcaster
+
+ADMIN_CHAT = 999
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.edits = []
+
+    async def edit_text(self, text):
+        self.edits.append(text)
+
+class FakeBot:
+    """send_message that records deliveries; errors[chat_id] lists exceptions to raise first."""
+
+    def __init__(self, errors=None, on_send=None):
+        self.errors = {chat_id: list(exceptions) for chat_id, exceptions in (errors or {}).items()}
+        self.on_send = on_send
+        self.delivered = []
+        self.status = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id == ADMIN_CHAT:
+            self.status.append(FakeMessage(text))
+            return self.status[-1]
+        if self.on_send is not None:
+            await self.on_send(chat_id)
+        if self.errors.get(chat_id):
+            raise self.errors[chat_id].pop(0)
+        self.delivered.append(chat_id)
+        return FakeMessage(text)
+
+@pytest.fixture
+def sleeps(clock, monkeypatch):
+    """Make asyncio.sleep advance the fake clock instead of waiting."""
+    slept = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(seconds, *args):
+        slept.append(seconds)
+        # A real sleep always lets some time pass; tiny waits would not move a float clock.
+        clock.advance(max(seconds, 1e-6))
+        await real_sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return slept
+
+@pytest.fixture
+def users(db):
+    for user_id in range(1, 7):
+        db.add_user(user_id, "user", "User")
+    return list(range(1, 7))
+
+def unreachable(db):
+    return [row[0] for row in db.get_connection().execute("SELECT user_id FROM users WHERE unreachable = 1")]
+
+def status(broadcast_id):
+    return database.get_broadcast_status(broadcast_id)
+
+def test_sends_to_everyone_and_marks_unreachable(users, clock, sleeps):
+    bot = FakeBot(errors={
+        2: [Forbidden("bot was blocked by the user")],
+        3: [BadRequest("Chat not found")],
+        4: [BadRequest("Message is too long")],
+    })
+
+    async def main():
+        broadcaster = Broadcaster(rate=10, page_size=4, clock=clock)
+        broadcast_id = await broadcaster.start(bot, "hello", ADMIN_CHAT)
+        await broadcaster._task
+        return broadcaster, broadcast_id
+
+    broadcaster, broadcast_id = asyncio.run(main())
+    assert sorted(bot.delivered) == [1, 5, 6]
+    assert broadcaster.progress == {**broadcaster.progress, "sent": 3, "failed": 1, "unreachable": 2}
+    assert unreachable(database) == [2, 3]
+    assert status(broadcast_id) == "done"
+    assert "done" in bot.status[0].edits[-1]
+
+def test_retry_after_pauses_and_lowers_the_rate(users, clock, sleeps):
+    bot = FakeBot(errors={3: [RetryAfter(5)]})
+
+    async def main():
+        broadcaster = Broadcaster(rate=10, page_size=10, clock=clock)
+        await broadcaster.start(bot, "hello", ADMIN_CHAT)
+        await broadcaster._task
+        return broadcaster
+
+    broadcaster = asyncio.run(main())
+    assert sorted(bot.delivered) == users  # the flood wait is not a failure
+    assert broadcaster.progress["failed"] == 0
+    assert any(seconds >= 4.9 for seconds in sleeps)
+    assert broadcaster._bucket.rate < 10  # halved, then raised slowly by the successes after it
+
+def test_network_errors_are_retried_then_counted_as_failed(users, clock, sleeps):
+    bot = FakeBot(errors={2: [NetworkError("timed out")], 4: [NetworkError("timed out")] * 3})
+
+    async def main():
+        broadcaster = Broadcaster(rate=10, page_size=10, max_attempts=3, clock=clock)
+        await broadcaster.start(bot, "hello", ADMIN_CHAT)
+        await broadcaster._task
+        return broadcaster
+
+    broadcaster = asyncio.run(main())
+    assert 2 in bot.delivered and 4 not in bot.delivered
+    assert broadcaster.progress["failed"] == 1
+    assert unreachable(database) == []
+
+def test_resumes_after_the_checkpoint(users, clock, sleeps):
+    broadcast_id = database.create_broadcast("hello", ADMIN_CHAT)
+    database.checkpoint_broadcast(broadcast_id, 3, 2, 0, [2])  # crashed after the first page
+    bot = FakeBot()
+
+    async def main():
+        broadcaster = Broadcaster(rate=10, page_size=3, clock=clock)
+        assert await broadcaster.resume(bot, owns=lambda chat_id: False) is None
+        job = await broadcaster.resume(bot)
+        await broadcaster._task
+        return job
+
+    job = asyncio.run(main())
+    assert job["id"] == broadcast_id
+    assert sorted(bot.delivered) == [4, 5, 6]
+    assert (job["sent"], job["unreachable"]) == (5, 1)
+    assert status(broadcast_id) == "done"
+
+def test_cancel_from_another_process_stops_the_sender(users, clock, sleeps):
+    other_process = Broadcaster(clock=clock)
+
+    async def cancel_during_second_page(chat_id):
+        if chat_id == 3:
+            assert await other_process.cancel() is not None
+
+    bot = FakeBot(on_send=cancel_during_second_page)
+
+    async def main():
+        broadcaster = Broadcaster(rate=10, page_size=2, clock=clock)
+        broadcast_id = await broadcaster.start(bot, "hello", ADMIN_CHAT)
+        await broadcaster._task
+        return broadcast_id
+
+    broadcast_id = asyncio.run(main())
+    assert sorted(bot.delivered) == [1, 2, 3, 4]  # stops at the checkpoint after the page
+    assert status(broadcast_id) == "cancelled"
+    assert "cancelled" in bot.status[0].edits[-1]
+    assert database.get_running_broadcast() is None
+
+def test_start_refuses_while_a_broadcast_is_unfinished(users, clock):
+    database.create_broadcast("left over", ADMIN_CHAT)
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await Broadcaster(clock=clock).start(FakeBot(), "hello", ADMIN_CHAT)
+
+    asyncio.run(main())
@@ -0,0 +1,40 @@
+import asyncio
+
+from dedup import UpdateDeduplicator
+
+def test_second_claim_is_a_duplicate(db):
+    async def main():
+        dedup = UpdateDeduplicator()
+        return await dedup.claim(1, 10), await dedup.claim(1, 10), await dedup.claim(1, 11)
+
+    assert asyncio.run(main()) == (True, False, True)
+
+def test_claim_is_shared_through_the_database(db):
+    async def main():
+        first, other_process = UpdateDeduplicator(), UpdateDeduplicator()
+        assert await first.claim(1, 10)
+        in_flight = await other_process.claim(1, 10)
+        await first.finish(1, 10)
+        return in_flight, await UpdateDeduplicator().claim(1, 10)
+
+    assert asyncio.run(main()) == (False, False)
+
+def test_stale_claim_is_taken_over(db):
+    async def main():
+        crashed = UpdateDeduplicator()
+        await crashed.claim(1, 10)
+        return await UpdateDeduplicator(stale_after=-1).claim(1, 10)
+
+    assert asyncio.run(main())
+
+def test_stop_releases_unfinished_claims(db):
+    async def main():
+        dedup = UpdateDeduplicator()
+        await dedup.claim(1, 10)
+        await dedup.claim(1, 11)
+        await dedup.finish(1, 11)
+        await dedup.stop()
+        restarted = UpdateDeduplicator()
+        return await restarted.claim(1, 10), await restarted.claim(1, 11)
+
+    assert asyncio.run(main()) == (True, False)
@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+import dedup
+import ratelimit
+import sessions
+
+class FakeMessage:
+    def __init__(self, message_id, text):
+        self.chat_id = 7
+        self.message_id = message_id
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+def make_update(message_id, text="hi"):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=7), message=FakeMessage(message_id, text))
+
+@pytest.fixture
+def handler(db, monkeypatch):
+    db.add_user(7, "user", "User")
+    monkeypatch.setattr(bot, "DEDUP", dedup.UpdateDeduplicator())
+    monkeypatch.setattr(bot, "SESSIONS", sessions.SessionStore())
+    monkeypatch.setattr(bot, "RATE_LIMITER", ratelimit.RateLimiter(period=30, burst=10))
+    monkeypatch.setattr(bot, "COALESCE_MESSAGES", True)
+    return db
+
+def done(db, message_id):
+    row = db.get_connection().execute(
+        "SELECT done FROM processed_updates WHERE chat_id = 7 AND message_id = ?", (message_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+def test_follow_ups_are_coalesced(handler, monkeypatch):
+    answered = []
+    started = asyncio.Event()
+
+    async def generate_reply(update, context, user_text):
+        answered.append(user_text)
+        started.set()
+        await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(bot, "generate_reply", generate_reply)
+
+    async def main():
+        first = asyncio.create_task(bot.handle_message(make_update(1, "a"), None))
+        await started.wait()
+        await bot.handle_message(make_update(2, "b"), None)
+        await bot.handle_message(make_update(3, "c"), None)
+        await first
+
+    asyncio.run(main())
+    assert answered == ["a", "b\nc"]
+    assert [done(handler, i) for i in (1, 2, 3)] == [1, 1, 1]
+
+def test_failed_reply_answers_queued_follow_ups(handler, monkeypatch):
+    started = asyncio.Event()
+
+    async def generate_reply(update, context, user_text):
+        started.set()
+        await asyncio.sleep(0.01)
+        raise RuntimeError("telegram is down")
+
+    monkeypatch.setattr(bot, "generate_reply", generate_reply)
+    follow_up = make_update(2)
+
+    async def main():
+        first = asyncio.create_task(bot.handle_message(make_update(1), None))
+        await started.wait()
+        await bot.handle_message(follow_up, None)
+        with pytest.raises(RuntimeError):
+            await first
+        assert bot.DEDUP._in_flight == set()
+
+    asyncio.run(main())
+    assert follow_up.message.replies == [bot.TEXTS["en"]["error_processing"]]
+    assert [done(handler, i) for i in (1, 2)] == [1, 1]
+    assert 7 not in bot._coalesced
@@ -0,0 +1,18 @@
+import importlib
+
+import pytest
+
+MODULES = [
+    "admin", "audio", "broadcast", "database", "dedup", "llm", "memory", "metrics", "ratelimit",
+    "scheduler", "sessions", "speech", "tts", "upsell", "voices", "webhook", "bot",
+]
+
+@pytest.mark.parametrize("name", MODULES)
+def test_module_imports(name):
+    importlib.import_module(name)
+
+def test_application_builds():
+    import bot
+    application = bot.build_application(updater=False)
+    assert application.bot_data["sessions"] is bot.SESSIONS
+    assert application.handlers
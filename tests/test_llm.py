@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from llm import CircuitBreaker, LLMRouter
+
+class FakeCompletions:
+    """chat.completions of an OpenAI client; behaviour per model is (delay, text or exception)."""
+
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.calls = []
+        self.cancelled = []
+
+    async def create(self, model, messages, extra_body=None, timeout=None, stream=False):
+        self.calls.append(model)
+        delay, result = self.behaviour[model]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        if isinstance(result, Exception):
+            raise result
+        message = SimpleNamespace(content=result)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+def make_router(behaviour, **kwargs):
+    completions = FakeCompletions(behaviour)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return LLMRouter(client, list(behaviour), **kwargs), completions
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+def test_primary_answers():
+    router, completions = make_router({"a": (0, "from a"), "b": (0, "from b")})
+    assert asyncio.run(router.complete(MESSAGES)) == "from a"
+    assert completions.calls == ["a"]
+
+def test_falls_back_on_error():
+    router, completions = make_router({"a": (0, RuntimeError("503")), "b": (0, "from b")})
+    assert asyncio.run(router.complete(MESSAGES)) == "from b"
+    assert completions.calls == ["a", "b"]
+    assert router.stats()["a"]["error"] == 1
+
+def test_empty_completion_falls_back():
+    router, _ = make_router({"a": (0, ""), "b": (0, "from b")})
+    assert asyncio.run(router.complete(MESSAGES)) == "from b"
+
+def test_all_models_fail():
+    router, _ = make_router({"a": (0, RuntimeError("a down")), "b": (0, RuntimeError("b down"))})
+    with pytest.raises(RuntimeError, match="b down"):
+        asyncio.run(router.complete(MESSAGES))
+
+def test_deadline_counts_as_failure():
+    router, completions = make_router({"a": (1, "late"), "b": (0, "from b")}, deadline=0.05, hedge_after=10)
+    assert asyncio.run(router.complete(MESSAGES)) == "from b"
+    assert completions.cancelled == ["a"]
+
+def test_hedges_slow_primary():
+    router, completions = make_router({"a": (1, "from a"), "b": (0.01, "from b")}, hedge_after=0.05)
+    assert asyncio.run(router.complete(MESSAGES)) == "from b"
+    assert completions.calls == ["a", "b"]
+    assert completions.cancelled == ["a"]  # the losing request is not left running
+
+def test_primary_can_win_the_hedge():
+    router, completions = make_router({"a": (0.1, "from a"), "b": (1, "from b")}, hedge_after=0.05)
+    assert asyncio.run(router.complete(MESSAGES)) == "from a"
+    assert completions.cancelled == ["b"]
+
+def test_open_breaker_skips_model():
+    router, completions = make_router({"a": (0, RuntimeError("503")), "b": (0, "from b")}, breaker_threshold=2)
+
+    async def main():
+        for _ in range(3):
+            await router.complete(MESSAGES)
+
+    asyncio.run(main())
+    assert completions.calls == ["a", "b", "a", "b", "b"]
+    assert router.stats()["a"]["circuit_open"]
+
+def test_breaker_half_opens_after_cooldown():
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.failure(now=0)
+    assert not breaker.allow(now=30)
+    assert breaker.allow(now=60)  # one probe
+    assert not breaker.allow(now=61)
+    breaker.success()
+    assert breaker.allow(now=62) and not breaker.is_open
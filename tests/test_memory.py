@@ -0,0 +1,136 @@
+import asyncio
+
+from memory import ASSISTANT, USER, ConversationMemory
+
+class FakeSummarizer:
+    """summarize(summary, turns) for ConversationMemory; fails the first `failures` calls."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+
+    async def __call__(self, summary, turns):
+        self.calls.append((summary, turns))
+        if len(self.calls) <= self.failures:
+            raise RuntimeError("LLM unavailable")
+        return f"summary #{len(self.calls)} of {len(turns)} turns"
+
+def seqs(db, user_id):
+    return [seq for seq, _, _ in db.load_conversation(user_id)[2]]
+
+def test_turns_survive_eviction(db):
+    async def main():
+        memory = ConversationMemory(FakeSummarizer(), max_turns=6, max_users=1)
+        conversation = await memory.get(1)
+        await memory.add_exchange(conversation, "q1", "a1")
+        await memory.add_exchange(conversation, "q2", "a2")
+        await memory.get(2)  # evicts user 1
+        reloaded = await memory.get(1)
+        assert reloaded is not conversation
+        assert list(reloaded.turns) == list(conversation.turns)
+        await memory.add_exchange(reloaded, "q3", "a3")
+        return reloaded
+
+    reloaded = asyncio.run(main())
+    assert [seq for seq, _, _ in reloaded.turns] == [1, 2, 3, 4, 5, 6]
+    assert seqs(db, 1) == [1, 2, 3, 4, 5, 6]
+
+def test_summary_folds_overflow_at_summarize_every(db):
+    summarize = FakeSummarizer()
+
+    async def main():
+        memory = ConversationMemory(summarize, max_turns=2, summarize_every=4)
+        conversation = await memory.get(1)
+        for i in range(1, 3):
+            await memory.add_exchange(conversation, f"q{i}", f"a{i}")
+        assert summarize.calls == []  # 2 turns pushed out, not enough yet
+        await memory.add_exchange(conversation, "q3", "a3")
+        await memory.stop()
+        return memory, conversation
+
+    memory, conversation = asyncio.run(main())
+    assert summarize.calls == [(None, [(USER, "q1"), (ASSISTANT, "a1"), (USER, "q2"), (ASSISTANT, "a2")])]
+    assert conversation.summary == "summary #1 of 4 turns"
+    assert conversation.overflow == []
+    assert seqs(db, 1) == [5, 6]  # the summarized turns are deleted
+    assert db.load_conversation(1)[:2] == ("summary #1 of 4 turns", 4)
+    messages = memory.prompt(conversation, "system", "new")
+    assert "summary #1 of 4 turns" in messages[0]["content"]
+    assert [m["content"] for m in messages[1:]] == ["q3", "a3", "new"]
+
+def test_reload_after_summary_continues_numbering(db):
+    async def main():
+        memory = ConversationMemory(FakeSummarizer(), max_turns=2, summarize_every=2)
+        conversation = await memory.get(1)
+        for i in range(1, 3):
+            await memory.add_exchange(conversation, f"q{i}", f"a{i}")
+        await memory.stop()
+
+        restarted = ConversationMemory(FakeSummarizer(), max_turns=2, summarize_every=2)
+        reloaded = await restarted.get(1)
+        assert reloaded.summary == "summary #1 of 2 turns"
+        assert [text for _, _, text in reloaded.turns] == ["q2", "a2"]
+        await restarted.add_exchange(reloaded, "q3", "a3")
+        await restarted.stop()
+        return reloaded
+
+    reloaded = asyncio.run(main())
+    assert [seq for seq, _, _ in reloaded.turns] == [5, 6]
+    assert db.load_conversation(1)[1] == 4
+    assert seqs(db, 1) == [5, 6]
+
+def test_unsummarized_overflow_is_folded_after_reload(db):
+    summarize = FakeSummarizer(failures=1)
+
+    async def main():
+        memory = ConversationMemory(summarize, max_turns=2, summarize_every=2)
+        conversation = await memory.get(1)
+        for i in range(1, 3):
+            await memory.add_exchange(conversation, f"q{i}", f"a{i}")
+        await memory.stop()  # the summary failed; turns 1-2 are still only in SQLite
+
+        restarted = ConversationMemory(summarize, max_turns=2, summarize_every=2)
+        reloaded = await restarted.get(1)  # overflow is rebuilt and folded right away
+        await restarted.stop()
+        return reloaded
+
+    reloaded = asyncio.run(main())
+    assert [turns for _, turns in summarize.calls] == [[(USER, "q1"), (ASSISTANT, "a1")]] * 2
+    assert reloaded.summary == "summary #2 of 2 turns"
+    assert seqs(db, 1) == [3, 4]
+
+def test_failed_summary_is_retried_after_next_exchange(db):
+    summarize = FakeSummarizer(failures=1)
+
+    async def main():
+        memory = ConversationMemory(summarize, max_turns=2, summarize_every=2)
+        conversation = await memory.get(1)
+        for i in range(1, 3):
+            await memory.add_exchange(conversation, f"q{i}", f"a{i}")
+        await memory.stop()
+        assert conversation.summary is None
+        assert [seq for seq, _, _ in conversation.overflow] == [1, 2]
+        assert not conversation.summarizing
+
+        await memory.add_exchange(conversation, "q3", "a3")
+        await memory.stop()
+        return conversation
+
+    conversation = asyncio.run(main())
+    assert len(summarize.calls) == 2
+    assert [len(turns) for _, turns in summarize.calls] == [2, 4]
+    assert conversation.summary == "summary #2 of 4 turns"
+    assert conversation.overflow == []
+    assert seqs(db, 1) == [5, 6]
+
+def test_history_fits_token_budget_and_starts_with_user(db):
+    async def main():
+        memory = ConversationMemory(FakeSummarizer(), max_turns=6, token_budget=10)
+        conversation = await memory.get(1)
+        await memory.add_exchange(conversation, "x" * 30, "y" * 3)
+        await memory.add_exchange(conversation, "q", "a" * 12)
+        return memory.prompt(conversation, "system", "new")
+
+    messages = asyncio.run(main())
+    # "x"*30 is over the budget; "y"*3 fits but would make history start with the assistant
+    assert [m["content"] for m in messages] == ["system", "q", "a" * 12, "new"]
@@ -0,0 +1,36 @@
+import pytest
+
+from ratelimit import RateLimiter, TokenBucket
+
+def test_bucket_refills_over_time():
+    bucket = TokenBucket(capacity=2, rate=1, now=0)
+    assert bucket.take(0) == 0
+    assert bucket.take(0) == 0
+    assert bucket.take(0) == pytest.approx(1)
+    assert bucket.take(0.5) == pytest.approx(0.5)
+    assert bucket.take(1) == 0
+
+def test_bucket_never_exceeds_capacity():
+    bucket = TokenBucket(capacity=2, rate=1, now=0)
+    bucket.take(100)
+    bucket.take(100)
+    assert bucket.take(100) > 0
+
+def test_limiter_allows_burst_then_waits(clock):
+    limiter = RateLimiter(period=10, burst=2, clock=clock)
+    assert limiter.check("a") == 0
+    assert limiter.check("a") == 0
+    assert limiter.check("a") == pytest.approx(10)
+    assert limiter.check("b") == 0  # keys are independent
+    clock.advance(10)
+    assert limiter.check("a") == 0
+
+def test_limiter_drops_least_recently_used(clock):
+    limiter = RateLimiter(period=10, max_keys=2, clock=clock)
+    limiter.check("a")
+    limiter.check("b")
+    limiter.check("a")  # "b" is now the least recently used
+    limiter.check("c")
+    assert len(limiter) == 2
+    assert limiter.check("a") > 0
+    assert limiter.check("b") == 0  # forgotten, so it starts full again
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from scheduler import LANE_FREE, LANE_PREMIUM, JobScheduler, QueueFull
+
+def test_returns_result_and_error():
+    async def main():
+        pool = JobScheduler(workers=1, max_depth={LANE_PREMIUM: 5, LANE_FREE: 5})
+        pool.start()
+
+        async def ok():
+            return 42
+
+        async def broken():
+            raise ValueError("boom")
+
+        try:
+            assert await pool.submit(LANE_FREE, ok) == 42
+            with pytest.raises(ValueError):
+                await pool.submit(LANE_FREE, broken)
+        finally:
+            await pool.stop()
+
+    asyncio.run(main())
+
+def test_premium_lane_goes_first():
+    async def main():
+        pool = JobScheduler(workers=1, max_depth={LANE_PREMIUM: 5, LANE_FREE: 5})
+        pool.start()
+        order = []
+        gate = asyncio.Event()
+
+        async def blocker():
+            await gate.wait()
+
+        def job(name):
+            async def run():
+                order.append(name)
+            return run
+
+        try:
+            first = pool.submit(LANE_FREE, blocker)
+            await asyncio.sleep(0)  # the worker picks up the blocker
+            jobs = [pool.submit(LANE_FREE, job("free")), pool.submit(LANE_PREMIUM, job("premium"))]
+            assert jobs[1].position == 1 and jobs[0].position == 1
+            gate.set()
+            await asyncio.gather(first, *jobs)
+        finally:
+            await pool.stop()
+        return order
+
+    assert asyncio.run(main()) == ["premium", "free"]
+
+def test_full_lane_sheds():
+    async def main():
+        pool = JobScheduler(workers=1, max_depth={LANE_PREMIUM: 1, LANE_FREE: 1})
+        pool.start()
+        gate = asyncio.Event()
+
+        async def blocker():
+            await gate.wait()
+
+        try:
+            running = pool.submit(LANE_FREE, blocker)
+            await asyncio.sleep(0)
+            queued = pool.submit(LANE_FREE, blocker)
+            with pytest.raises(QueueFull):
+                pool.submit(LANE_FREE, blocker)
+            pool.submit(LANE_PREMIUM, blocker)  # other lanes still accept
+            assert pool.stats()["shed"] == 1
+            gate.set()
+            await asyncio.gather(running, queued)
+        finally:
+            await pool.stop()
+
+    asyncio.run(main())
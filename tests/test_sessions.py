@@ -0,0 +1,118 @@
+import asyncio
+import datetime
+
+from sessions import SessionStore
+
+TODAY = str(datetime.date.today())
+YESTERDAY = str(datetime.date.today() - datetime.timedelta(days=1))
+
+def test_unknown_user(db):
+    async def main():
+        return await SessionStore().get(42)
+    assert asyncio.run(main()) is None
+
+def test_free_limit(db):
+    db.add_user(42, "user", "User")
+
+    async def main():
+        store = SessionStore()
+        session = await store.get(42)
+        return [store.reserve(session, 3) for _ in range(4)], session
+
+    results, session = asyncio.run(main())
+    assert results == [True, True, True, False]
+    assert session.messages_today == 3
+    assert session.day == TODAY
+
+def test_premium_has_no_limit(db):
+    db.add_user(42, "user", "User")
+    db.set_subscription(42, 1)
+
+    async def main():
+        store = SessionStore()
+        session = await store.get(42)
+        return [store.reserve(session, 3) for _ in range(5)]
+
+    assert all(asyncio.run(main()))
+
+def test_daily_reset(db):
+    db.add_user(42, "user", "User")
+    db.save_sessions([("en", None, 3, YESTERDAY, 42)])
+
+    async def main():
+        store = SessionStore()
+        session = await store.get(42)
+        return store.reserve(session, 3), session
+
+    allowed, session = asyncio.run(main())
+    assert allowed
+    assert session.messages_today == 1
+    assert session.day == TODAY
+
+def test_refund(db):
+    db.add_user(42, "user", "User")
+
+    async def main():
+        store = SessionStore()
+        session = await store.get(42)
+        for _ in range(3):
+            store.reserve(session, 3)
+        store.refund(session)
+        return store.reserve(session, 3), store.reserve(session, 3), session
+
+    retried, over_limit, session = asyncio.run(main())
+    assert retried and not over_limit
+    assert session.messages_today == 3
+
+def test_refund_of_yesterdays_slot_is_ignored(db):
+    db.add_user(42, "user", "User")
+    db.save_sessions([("en", None, 2, YESTERDAY, 42)])
+
+    async def main():
+        store = SessionStore()
+        session = await store.get(42)
+        store.refund(session)
+        return session
+
+    assert asyncio.run(main()).messages_today == 2
+
+def test_stop_flushes_pending_changes(db):
+    db.add_user(42, "user", "User")
+
+    async def main():
+        store = SessionStore(flush_interval=3600)
+        store.start()
+        session = await store.get(42)
+        store.reserve(session, 3)
+        store.update(session, lang="ru", voice_id="voice")
+        assert db.load_session(42)[3] == 0  # written behind, not yet
+        await store.stop()
+
+    asyncio.run(main())
+    assert db.load_session(42) == ("ru", "voice", 0, 1, TODAY)
+
+def test_dirty_session_outlives_eviction(db):
+    for user_id in (1, 2):
+        db.add_user(user_id, "user", "User")
+
+    async def main():
+        store = SessionStore(max_size=1)
+        session = await store.get(1)
+        store.update(session, lang="ru")
+        await store.get(2)  # evicts user 1 before it is flushed
+        return await store.get(1)
+
+    assert asyncio.run(main()).lang == "ru"
+
+def test_tier_is_rechecked_after_ttl(db, clock):
+    db.add_user(42, "user", "User")
+
+    async def main():
+        store = SessionStore(tier_ttl=300, clock=clock)
+        session = await store.get(42)
+        db.set_subscription(42, 1)
+        cached = (await store.get(42)).tier
+        clock.advance(301)
+        return cached, (await store.get(42)).tier
+
+    assert asyncio.run(main()) == (0, 1)
@@ -0,0 +1,99 @@
+import asyncio
+import datetime
+
+from sessions import SessionStore
+
+TODAY = str(datetime.date.today())
+YESTERDAY = str(datetime.date.today() - datetime.timedelta(days=1))
+
+def today(db):
+    stats = db.get_stats()
+    return stats["active_today"], stats["messages_today"]
+
+def run_store(steps):
+    """Apply steps(store, session) to user 42's session and flush like the bot does."""
+    async def main():
+        store = SessionStore()
+        session = await store.get(42)
+        for step in steps:
+            step(store, session)
+            await store.flush()
+    asyncio.run(main())
+
+def test_totals_follow_users_and_subscriptions(db):
+    for user_id in (1, 2, 3, 4):
+        db.add_user(user_id, "user", "User")
+    db.add_user(1, "user", "User")  # already known
+    db.set_subscription(1, 1)
+    db.set_subscription(1, 1)  # no change
+    stats = db.get_stats()
+    assert (stats["total_users"], stats["premium_users"], stats["new_today"]) == (4, 1, 4)
+    assert stats["premium_conversion"] == 0.25
+    db.set_subscription(1, 0)
+    assert db.get_stats()["premium_users"] == 0
+
+def test_messages_and_active_users_today(db):
+    db.add_user(42, "user", "User")
+    db.add_user(43, "user", "User")
+    assert today(db) == (0, 0)
+    run_store([lambda store, session: store.reserve(session)] * 2)
+    assert today(db) == (1, 2)
+    db.save_sessions([("en", None, 1, TODAY, 43)])
+    assert today(db) == (2, 3)
+
+def test_new_day_starts_from_zero(db):
+    db.add_user(42, "user", "User")
+    db.save_sessions([("en", None, 3, YESTERDAY, 42)])
+    assert today(db) == (0, 0)
+    run_store([lambda store, session: store.reserve(session)])
+    assert today(db) == (1, 1)
+    yesterday = db.get_connection().execute(
+        "SELECT active_users, messages FROM daily_stats WHERE day = ?", (YESTERDAY,)
+    ).fetchone()
+    assert yesterday == (1, 3)  # the old day is left alone
+
+def test_refund_gives_the_message_back(db):
+    db.add_user(42, "user", "User")
+    run_store([
+        lambda store, session: store.reserve(session),
+        lambda store, session: store.reserve(session),
+        lambda store, session: store.refund(session),
+    ])
+    assert today(db) == (1, 1)
+
+def test_language_only_update_changes_nothing(db):
+    db.add_user(42, "user", "User")
+    run_store([
+        lambda store, session: store.reserve(session),
+        lambda store, session: store.update(session, lang="ru"),
+        lambda store, session: store.update(session, voice_id="voice"),
+    ])
+    assert today(db) == (1, 1)
+
+def test_language_update_of_yesterdays_user_is_not_activity(db):
+    db.add_user(42, "user", "User")
+    db.save_sessions([("en", None, 3, YESTERDAY, 42)])
+    run_store([lambda store, session: store.update(session, lang="ru")])
+    assert today(db) == (0, 0)
+
+def test_init_db_again_does_not_seed_twice(db):
+    db.add_user(42, "user", "User")
+    db.set_subscription(42, 1)
+    run_store([lambda store, session: store.reserve(session)])
+    before = db.get_stats()
+    db.init_db()
+    assert db.get_stats() == before
+
+def test_counters_are_seeded_on_an_existing_database(db):
+    for user_id in (1, 2):
+        db.add_user(user_id, "user", "User")
+    db.set_subscription(1, 1)
+    db.save_sessions([("en", None, 2, TODAY, 1), ("en", None, 5, YESTERDAY, 2)])
+    conn = db.get_connection()
+    with conn:
+        conn.execute("DROP TABLE stats")
+        conn.execute("DROP TABLE daily_stats")
+    db.init_db()
+    stats = db.get_stats()
+    assert (stats["total_users"], stats["premium_users"]) == (2, 1)
+    assert today(db) == (1, 2)
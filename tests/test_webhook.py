@@ -0,0 +1,14 @@
+import webhook
+
+def test_messages_are_sharded_by_sender():
+    private = {"update_id": 1, "message": {"from": {"id": 7}, "chat": {"id": 7}}}
+    group = {"update_id": 2, "message": {"from": {"id": 7}, "chat": {"id": -100123}}}
+    assert webhook.shard_key(private) == webhook.shard_key(group) == 7
+
+def test_callbacks_are_sharded_by_sender():
+    update = {"update_id": 1, "callback_query": {"from": {"id": 7}, "message": {"chat": {"id": -100123}}}}
+    assert webhook.shard_key(update) == 7
+
+def test_updates_without_sender_use_the_chat():
+    assert webhook.shard_key({"update_id": 1, "channel_post": {"chat": {"id": -5}}}) == -5
+    assert webhook.shard_key({"update_id": 1}) == 0
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+from elevenlabs.client import AsyncElevenLabs
+from elevenlabs.core.api_error import ApiError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def is_format_rejection(error: ApiError) -> bool:
+    """True if ElevenLabs refused the request because of its output_format.
+
+    Plans without e.g. high-bitrate Opus answer 400/403/422 with a body naming
+    the output format; other 4xx (bad voice_id, invalid text) don't.
+    """
+    if error.status_code not in (400, 403, 422):
+        return False
+    body = str(error.body or "").lower()
+    return "output_format" in body or "output format" in body
+
+class TTSClient:
+    """Async ElevenLabs client with a concurrency cap matched to the plan.
+
+    All requests share one keep-alive HTTP connection pool. At most
+    `max_concurrency` syntheses run at once; the rest wait on a semaphore,
+    and `queue_depth` tells how many are waiting. 429s and 5xx responses are
+    retried with exponential backoff (honouring Retry-After when present).
+    """
+
+    def __init__(self, api_key: str, max_concurrency: int = 2, max_retries: int = 3,
+                 base_delay: float = 0.5, base_url: str = None):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+                keepalive_expiry=60,
+            ),
+            timeout=httpx.Timeout(120, connect=10),
+        )
+        self.client = AsyncElevenLabs(api_key=api_key, base_url=base_url, httpx_client=self._http)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.total_requests = 0
+        self.total_retries = 0
+        self.total_throttled = 0
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "requests": self.total_requests,
+            "retries": self.total_retries,
+            "throttled": self.total_throttled,
+        }
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        headers = getattr(error, "headers", None) or {}
+        retry_after = headers.get("retry-after") or headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.base_delay * (2 ** attempt) * (0.5 + random.random())
+
+    async def convert(self, text: str, voice_id: str, timing: dict = None, **kwargs) -> bytes:
+        """Synthesize text and return the complete audio as bytes.
+
+        If a `timing` dict is passed, the seconds spent on the upstream call
+        (retries included, queueing for a slot excluded) are added to
+        timing["upstream"].
+        """
+        self.queue_depth += 1
+        if self._semaphore.locked():
+            logger.info(f"TTS queue depth {self.queue_depth} (limit {self.max_concurrency} concurrent)")
+        waiting = True
+        try:
+            async with self._semaphore:
+                self.queue_depth -= 1
+                waiting = False
+                self.in_flight += 1
+                started = time.perf_counter()
+                try:
+                    return await self._convert_with_retry(text, voice_id, **kwargs)
+                finally:
+                    self.in_flight -= 1
+                    if timing is not None:
+                        timing["upstream"] = timing.get("upstream", 0.0) + time.perf_counter() - started
+        finally:
+            if waiting:
+                # Cancelled while still queued
+                self.queue_depth -= 1
+
+    async def _convert_with_retry(self, text: str, voice_id: str, **kwargs) -> bytes:
+        attempt = 0
+        while True:
+            self.total_requests += 1
+            try:
+                chunks = []
+                started = time.perf_counter()
+                first_byte = None
+                # The SDK's own retries are disabled so that backoff and counting happen here
+                stream = self.client.text_to_speech.convert(
+                    voice_id, text=text, request_options={"max_retries": 0}, **kwargs
+                )
+                async for chunk in stream:
+                    if first_byte is None:
+                        first_byte = time.perf_counter()
+                    chunks.append(chunk)
+                audio = b"".join(chunks)
+                done = time.perf_counter()
+                # Synthesis = until ElevenLabs starts answering, buffering = receiving and joining the body
+                metrics.observe("stage_seconds", (first_byte or done) - started, stage="tts_synthesis")
+                metrics.observe("stage_seconds", done - (first_byte or done), stage="tts_buffering")
+                return audio
+            except (ApiError, httpx.TransportError) as e:
+                metrics.inc("upstream_errors_total", upstream="elevenlabs")
+                status = getattr(e, "status_code", None)
+                retryable = isinstance(e, httpx.TransportError) or status in RETRY_STATUSES
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                if status == 429:
+                    self.total_throttled += 1
+                delay = self._retry_delay(attempt, e)
+                attempt += 1
+                self.total_retries += 1
+                metrics.inc("upstream_retries_total", upstream="elevenlabs")
+                logger.warning(f"TTS request failed ({status or type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        await self._http.aclose()
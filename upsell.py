@@ -0,0 +1,101 @@
+import os
+import re
+import asyncio
+import hashlib
+import logging
+
+import audio
+
+logger = logging.getLogger(__name__)
+
+# Names written by _path(): <voice>_<lang>_<format>_<12 hex digits>.<ext>
+CLIP_NAME = re.compile(r"^.+_[0-9a-f]{12}\.[a-z0-9]+$")
+
+class UpsellCache:
+    """Pre-rendered upsell tail clips, one per (voice, language).
+
+    The upsell phrase is the same for every free-tier reply, so it is
+    synthesized once, stored on disk and appended to the generated speech at
+    the audio level. The file name includes a hash of everything that affects
+    the sound (phrase text, TTS model, output format, the voice's preview_url),
+    so editing TEXTS or a voice changing in the catalog produces a new clip;
+    prune() removes the outdated ones. Clips are kept per output format so
+    they can be joined onto speech of the same audio profile.
+    """
+
+    def __init__(self, cache_dir: str, synthesize, model_id: str):
+        self.cache_dir = cache_dir
+        self.synthesize = synthesize  # async (text, voice_id, output_format) -> bytes
+        self.model_id = model_id
+        self._clips = {}
+        self._locks = {}
+
+    def _path(self, voice_id: str, lang: str, text: str, fingerprint: str, output_format: str):
+        digest = hashlib.sha1(f"{text}\0{self.model_id}\0{fingerprint}".encode()).hexdigest()[:12]
+        name = f"{voice_id}_{lang}_{output_format}_{digest}.{audio.extension(output_format)}"
+        return os.path.join(self.cache_dir, name)
+
+    async def get(self, voice_id: str, lang: str, text: str, fingerprint: str, output_format: str):
+        """Return the clip, loading it from disk or synthesizing it on first use."""
+        path = self._path(voice_id, lang, text, fingerprint, output_format)
+        clip = self._clips.get(path)
+        if clip is not None:
+            return clip
+        lock = self._locks.setdefault(path, asyncio.Lock())
+        async with lock:
+            clip = self._clips.get(path)
+            if clip is None:
+                clip = await asyncio.to_thread(self._read, path)
+            if clip is None:
+                clip = await self.synthesize(text, voice_id, output_format)
+                await asyncio.to_thread(self._write, path, clip)
+                logger.info(f"Rendered upsell clip {os.path.basename(path)} ({len(clip)} bytes)")
+            self._clips[path] = clip
+        self._locks.pop(path, None)
+        return clip
+
+    async def warm(self, items):
+        """Render clips ahead of time. items: iterable of (voice_id, lang, text, fingerprint, output_format)."""
+        for voice_id, lang, text, fingerprint, output_format in items:
+            try:
+                await self.get(voice_id, lang, text, fingerprint, output_format)
+            except Exception as e:
+                logger.warning(f"Could not pre-render upsell clip for {voice_id}/{lang}: {e}")
+
+    def prune(self, keep):
+        """Delete cached clips not in keep. keep: iterable of (voice_id, lang, text, fingerprint, output_format)."""
+        wanted = {self._path(*item) for item in keep}
+        self._clips = {path: clip for path, clip in self._clips.items() if path in wanted}
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            # Leave anything that isn't a finished clip alone, e.g. another
+            # worker's temp file that is about to be renamed into place.
+            if path in wanted or not CLIP_NAME.match(name):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue  # pruned by another worker at the same time
+            removed += 1
+        if removed:
+            logger.info(f"Removed {removed} outdated upsell clips.")
+        return removed
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
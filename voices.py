@@ -0,0 +1,152 @@
+import os
+import json
+import math
+import logging
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+# Logic: Free users get the first FREE_VOICES voices, others are premium.
+# This is a simple heuristic. You can also match by ID.
+FREE_VOICES = 3
+
+TIER_FREE = 0
+TIER_PREMIUM = 1
+
+class Voice:
+    """Compact voice record: only what the bot actually uses."""
+    __slots__ = ("voice_id", "name", "preview_url", "tier")
+
+    def __init__(self, voice_id: str, name: str, preview_url: str = None, tier: int = TIER_FREE):
+        self.voice_id = voice_id
+        self.name = name
+        self.preview_url = preview_url
+        self.tier = tier
+
+    def __repr__(self):
+        return f"Voice({self.voice_id!r}, {self.name!r}, tier={self.tier})"
+
+class VoiceCatalog:
+    """Voices indexed by id, with the inline keyboards for every page precomputed.
+
+    Keyboards depend only on (page, is_premium), so they are built once per
+    load() and handed out as-is on every page turn. The catalog can be saved
+    to and restored from a JSON snapshot, so the bot can serve voices right
+    after a restart without waiting for ElevenLabs.
+    """
+
+    def __init__(self, per_page: int = 5, free_count: int = FREE_VOICES):
+        self.per_page = per_page
+        self.free_count = free_count
+        self.voices = []
+        self.by_id = {}
+        self._keyboards = {}
+        self._signature = ()
+
+    def __len__(self):
+        return len(self.voices)
+
+    def __bool__(self):
+        return bool(self.voices)
+
+    @property
+    def total_pages(self):
+        return self._total_pages(self.voices)
+
+    def _total_pages(self, voices):
+        return max(1, math.ceil(len(voices) / self.per_page))
+
+    def load(self, sdk_voices) -> bool:
+        """Replace the catalog with voices from the ElevenLabs SDK.
+
+        Returns True if the catalog changed (ids, names, order or previews).
+        """
+        return self._load([
+            (v.voice_id, v.name, getattr(v, "preview_url", None) or None) for v in sdk_voices
+        ])
+
+    def _load(self, entries) -> bool:
+        signature = tuple(entries)
+        if signature == self._signature:
+            return False
+        records = [
+            Voice(voice_id, name, preview_url, TIER_FREE if i < self.free_count else TIER_PREMIUM)
+            for i, (voice_id, name, preview_url) in enumerate(entries)
+        ]
+        total_pages = self._total_pages(records)
+        keyboards = {
+            (page, is_premium): self._build_keyboard(records, page, is_premium, total_pages)
+            for page in range(total_pages) for is_premium in (False, True)
+        }
+        # Swap everything in at once (no awaits in between), so readers never
+        # see voices from one load and keyboards from another.
+        self.voices = records
+        self.by_id = {v.voice_id: v for v in records}
+        self._keyboards = keyboards
+        self._signature = signature
+        return True
+
+    def save_snapshot(self, path: str):
+        """Write the catalog to path atomically (tmp file + rename)."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump([{"voice_id": voice_id, "name": name, "preview_url": preview_url}
+                       for voice_id, name, preview_url in self._signature], f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def load_snapshot(self, path: str) -> bool:
+        """Load the catalog saved by save_snapshot.
+
+        Returns False if there is no usable snapshot; a broken one is logged and
+        ignored so the bot still starts and the background refresh fills the catalog.
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f)
+            entries = [(e["voice_id"], e["name"], e.get("preview_url")) for e in entries]
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"Ignoring unreadable voice snapshot {path}: {e!r}")
+            return False
+        self._load(entries)
+        return bool(self.voices)
+
+    def get(self, voice_id: str):
+        return self.by_id.get(voice_id)
+
+    def default_voice_id(self):
+        return self.voices[0].voice_id if self.voices else None
+
+    def keyboard(self, page: int = 0, is_premium: bool = False):
+        page = min(max(page, 0), self.total_pages - 1)
+        markup = self._keyboards.get((page, bool(is_premium)))
+        if markup is None:
+            markup = self._build_keyboard(self.voices, page, bool(is_premium), self.total_pages)
+        return markup
+
+    def _build_keyboard(self, voices, page: int, is_premium: bool, total_pages: int):
+        start_idx = page * self.per_page
+        keyboard = []
+        for voice in voices[start_idx:start_idx + self.per_page]:
+            lock_icon = "" if (is_premium or voice.tier == TIER_FREE) else "💎 "
+            keyboard.append([
+                # Button to Select Voice
+                InlineKeyboardButton(f"{lock_icon}{voice.name}", callback_data=f"select_{voice.voice_id}"),
+                # Button to Preview
+                InlineKeyboardButton("📢", callback_data=f"preview_{voice.voice_id}"),
+            ])
+
+        # Navigation
+        nav_row = []
+        if page > 0:
+            nav_row.append(InlineKeyboardButton("⬅️", callback_data=f"page_{page-1}"))
+        nav_row.append(InlineKeyboardButton(f"{page+1}/{total_pages}", callback_data="noop"))
+        if page < total_pages - 1:
+            nav_row.append(InlineKeyboardButton("➡️", callback_data=f"page_{page+1}"))
+        keyboard.append(nav_row)
+        return InlineKeyboardMarkup(keyboard)
@@ -0,0 +1,143 @@
+import os
+import json
+import signal
+import asyncio
+import logging
+import multiprocessing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from telegram import Bot, Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def worker_for(chat_id: int, workers: int) -> int:
+    """Index of the worker that handles a chat."""
+    return chat_id % workers
+
+def shard_key(update: dict) -> int:
+    """Id of the user behind an update (or of its chat), used to pick the worker.
+
+    All updates of one user go to the same worker, whichever chat (private
+    or group) they come from, so per-user in-memory state (session cache and
+    daily quota, rate limits, coalescing) has a single writer. Updates
+    without a sender (channel posts) go by chat.
+    """
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        sender = value.get("from") or {}
+        if "id" in sender:
+            return sender["id"]
+        chat = value.get("chat") or {}
+        if "id" in chat:
+            return chat["id"]
+    return 0
+
+class Server(ThreadingHTTPServer):
+    """HTTP server for webhook deliveries.
+
+    Telegram opens up to 100 parallel webhook connections (max_connections);
+    the socketserver default backlog of 5 resets them under load. Handler
+    threads are daemons, so a stuck connection doesn't block shutdown.
+    """
+    daemon_threads = True
+    request_queue_size = 256
+
+def make_handler(path: str, secret: str, queues):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != path:
+                self.send_error(404)
+                return
+            if secret and self.headers.get(SECRET_HEADER) != secret:
+                self.send_error(403)
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                update = json.loads(body)
+            except ValueError:
+                self.send_error(400)
+                return
+            queues[worker_for(shard_key(update), len(queues))].put(body)
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return WebhookHandler
+
+async def _run_worker(index: int, build_application, queue):
+    application = build_application(updater=False)
+    loop = asyncio.get_running_loop()
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        logger.info(f"Webhook worker {index} ready")
+        try:
+            while True:
+                body = await loop.run_in_executor(None, queue.get)
+                if body is None:
+                    break
+                await application.update_queue.put(Update.de_json(json.loads(body), application.bot))
+        finally:
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+def worker_main(index: int, build_application, queue):
+    """Entry point of a worker process: one Application fed from its queue."""
+    # force: the handler set up by the parent (inherited on fork) is replaced
+    logging.basicConfig(
+        format=f'%(asctime)s - worker{index} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO,
+        force=True,
+    )
+    # Lets the bot tell workers apart (e.g. metrics port offset)
+    os.environ["WORKER_INDEX"] = str(index)
+    # Ctrl+C goes to the whole process group; the parent stops us via the queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_run_worker(index, build_application, queue))
+
+def serve(build_application, token: str, listen: str = "0.0.0.0", port: int = 8443,
+          path: str = "/telegram", secret: str = None, webhook_url: str = None,
+          workers: int = 1, base_url: str = None):
+    """Receive updates over HTTP and shard them by sender across worker processes.
+
+    build_application(updater=False) must return a configured Application; it
+    is called once in every worker. If webhook_url is given the webhook is
+    registered with Telegram first.
+    """
+    if webhook_url:
+        async def register():
+            bot = Bot(token, base_url=f"{base_url}/bot" if base_url else None)
+            async with bot:
+                await bot.set_webhook(webhook_url, secret_token=secret, allowed_updates=Update.ALL_TYPES)
+        asyncio.run(register())
+        logger.info(f"Webhook registered at {webhook_url}")
+
+    queues = [multiprocessing.Queue() for _ in range(workers)]
+    server = Server((listen, port), make_handler(path, secret, queues))
+    processes = [
+        multiprocessing.Process(target=worker_main, args=(i, build_application, q), name=f"worker{i}", daemon=True)
+        for i, q in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    logger.info(f"Listening for updates on {listen}:{port}{path} with {workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for q in queues:
+            q.put(None)
+        for process in processes:
+            process.join(timeout=30)